@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightGeneration:
+    """
+    一次正在进行的 LLM 生成。生成任务独立于订阅者运行，
+    已产生的 token 全部保留，后加入的订阅者会先收到已有 token 再接收实时 token。
+    """
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.changed = asyncio.Condition()
+
+    async def _publish(self, token: Optional[str] = None, finished: bool = False, error: BaseException = None):
+        async with self.changed:
+            if token is not None:
+                self.tokens.append(token)
+            if finished:
+                self.done = True
+                self.error = error
+            self.changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """依次产出全部 token（先回放，再实时），生成失败时抛出原始异常"""
+        index = 0
+        while True:
+            async with self.changed:
+                while index >= len(self.tokens) and not self.done:
+                    await self.changed.wait()
+                pending = self.tokens[index:]
+                index = len(self.tokens)
+                finished = self.done
+                error = self.error
+
+            for token in pending:
+                yield token
+
+            if finished and index >= len(self.tokens):
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """按 key 合并相同的进行中生成：重复请求挂到已有生成上，token 流扇出给所有订阅者"""
+
+    def __init__(self):
+        self.inflight: Dict[Hashable, InFlightGeneration] = {}
+        self.avg_completion_tokens = 0.0  # 完整生成的平均 token 数，用于估算中止后节省的 token
+
+    def is_inflight(self, key: Hashable) -> bool:
+        return key in self.inflight
+
+    def has_query(self, query: str, provider: str, model: str) -> bool:
+        """检索完成之前的粗略判断：是否已有相同问题/模型的生成在进行（key 中不比较来源 ID）"""
+        return any(k[0] == query and k[2:] == (provider, model) for k in self.inflight)
+
+    def join(self, key: Hashable, producer: Callable[[], AsyncIterator[str]]) -> InFlightGeneration:
+        """加入 key 对应的生成；不存在时用 producer() 启动一个新的生成"""
+        generation = self.inflight.get(key)
+        if generation is not None:
+            metrics.inc("llm_coalesced_total")
+            logger.info(f"Coalesced duplicate generation ({generation.subscribers} subscribers already attached)")
+        else:
+            generation = InFlightGeneration(key)
+            self.inflight[key] = generation
+            generation.task = asyncio.create_task(self._run(generation, producer))
+        generation.subscribers += 1
+        return generation
+
+    def leave(self, generation: InFlightGeneration):
+        """订阅者离开；最后一个订阅者离开且生成未结束时，取消上游生成以释放 provider 名额"""
+        generation.subscribers -= 1
+        if generation.subscribers > 0 or generation.done or generation.task is None:
+            return
+
+        generation.task.cancel()
+        produced = len(generation.tokens)
+        saved = max(0, round(self.avg_completion_tokens - produced))
+        metrics.inc("llm_generations_aborted_total")
+        metrics.inc("llm_tokens_saved_total", saved)
+        logger.info(f"All clients disconnected, aborted upstream generation after {produced} tokens "
+                    f"(~{saved} tokens saved, based on average completion length)")
+
+    async def _run(self, generation: InFlightGeneration, producer: Callable[[], AsyncIterator[str]]):
+        try:
+            async for token in producer():
+                await generation._publish(token)
+            await generation._publish(finished=True)
+            count = len(generation.tokens)
+            if self.avg_completion_tokens == 0:
+                self.avg_completion_tokens = float(count)
+            else:
+                self.avg_completion_tokens = 0.9 * self.avg_completion_tokens + 0.1 * count
+        except asyncio.CancelledError:
+            await generation._publish(finished=True, error=RuntimeError("Generation cancelled"))
+            raise
+        except Exception as e:
+            await generation._publish(finished=True, error=e)
+        finally:
+            # 生成结束即移除，之后的相同请求会重新生成
+            if self.inflight.get(generation.key) is generation:
+                del self.inflight[generation.key]
+
+
+generation_flights = SingleFlight()
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+from typing import Dict
+
+from job_runners import JOB_RUNNERS
+from metrics import metrics
+from task_manager import task_manager, INDEX
+
+logger = logging.getLogger(__name__)
+
+# thread: 在 API 进程的后台线程中运行（默认）
+# process: 每个任务一个独立 Python 进程，嵌入 / 清洗 / 分块不再与 /search 争抢 GIL
+JOB_EXECUTION_MODE = os.getenv("JOB_EXECUTION_MODE", "thread")
+# 发出取消信号后等待 worker 自行退出的时间（秒），超时则强制结束进程
+JOB_CANCEL_GRACE_SECONDS = float(os.getenv("JOB_CANCEL_GRACE_SECONDS", "30"))
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_worker.py")
+
+
+class JobExecutor:
+    """
+    执行任务本体并把结果写回 TaskManager。
+    process 模式下日志 / 进度经 worker 的 stdout 逐行回传，取消信号经 stdin 发送，
+    worker 异常退出（没有返回结果）时按崩溃记录。
+    """
+
+    def __init__(self, mode: str = JOB_EXECUTION_MODE):
+        self.mode = mode if mode in ("thread", "process") else "thread"
+        self.processes: Dict[str, subprocess.Popen] = {}
+        self.lock = threading.Lock()
+
+    def run(self, task_key: str, job_type: str, target_id: int):
+        """阻塞直到任务结束；由 JobScheduler 的工作线程调用"""
+        job_id = task_manager.get_job_id(task_key)
+        stop_event = task_manager.get_stop_event(task_key)
+        try:
+            if self.mode == "process":
+                status, final_metrics, error_msg = self._run_in_process(task_key, job_type, target_id, stop_event)
+            else:
+                def log_cb(msg, type="log", data=None):
+                    task_manager.add_log(task_key, msg, type=type, data=data)
+
+                status, final_metrics, error_msg = JOB_RUNNERS[job_type](target_id, stop_event, log_cb)
+        except Exception as e:
+            logger.error(f"Background job {task_key} error: {e}", exc_info=True)
+            status, final_metrics, error_msg = "error", None, str(e)
+
+        task_manager.finish_task(task_key, status=status, job_metrics=final_metrics, error_msg=error_msg)
+        # Allow some time for SSE to drain before cleanup (does not hold the worker slot)
+        task_manager.schedule_cleanup(task_key, job_id, delay=10)
+
+    def _run_in_process(self, task_key: str, job_type: str, target_id: int, stop_event: threading.Event):
+        proc = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, job_type, str(target_id)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None,  # 继承 API 进程的 stderr，便于排查
+            cwd=os.getcwd(),
+            text=True,
+            encoding="utf-8",
+            bufsize=1
+        )
+        with self.lock:
+            self.processes[task_key] = proc
+        metrics.set_gauge("job_worker_processes", len(self.processes))
+
+        threading.Thread(
+            target=self._forward_cancel, args=(task_key, proc, stop_event),
+            name=f"job-cancel-{task_key}", daemon=True
+        ).start()
+
+        result = None
+        try:
+            for line in proc.stdout:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("event") == "log":
+                    task_manager.add_log(task_key, event.get("message"),
+                                         type=event.get("type") or "log", data=event.get("data"))
+                elif event.get("event") == "result":
+                    result = event
+            returncode = proc.wait()
+        finally:
+            with self.lock:
+                self.processes.pop(task_key, None)
+            metrics.set_gauge("job_worker_processes", len(self.processes))
+
+        if result is not None:
+            return result.get("status", "error"), result.get("metrics"), result.get("error")
+
+        # worker 没有返回结果就退出：索引任务的 PDF 停在 processing，标记为 cancelled 以便续传
+        if job_type == INDEX:
+            self._mark_pdf_interrupted(target_id)
+
+        if stop_event.is_set():
+            # 取消后超时被强制结束
+            task_manager.add_log(task_key, "🛑 Worker terminated after cancellation")
+            return "cancelled", None, None
+
+        metrics.inc("job_worker_crashes_total", job_type=job_type)
+        error_msg = f"Worker process exited unexpectedly (exit code {returncode})"
+        logger.error(f"Background job {task_key}: {error_msg}")
+        task_manager.add_log(task_key, f"❌ {error_msg}")
+        return "error", None, error_msg
+
+    @staticmethod
+    def _mark_pdf_interrupted(pdf_id: int):
+        try:
+            from pdf_schema import get_pdf_by_id, update_pdf_status
+            pdf_record = get_pdf_by_id(pdf_id)
+            if pdf_record and pdf_record.get("indexing_status") == "processing":
+                update_pdf_status(pdf_id, "cancelled")
+        except Exception as e:
+            logger.warning(f"Failed to mark PDF {pdf_id} as cancelled: {e}")
+
+    def _forward_cancel(self, task_key: str, proc: subprocess.Popen, stop_event: threading.Event):
+        """把 TaskManager 的停止信号转发给 worker，宽限期后仍未退出则强制结束"""
+        while proc.poll() is None:
+            if not stop_event.wait(0.5):
+                continue
+            try:
+                proc.stdin.write("stop\n")
+                proc.stdin.flush()
+            except (BrokenPipeError, OSError, ValueError):
+                pass
+            try:
+                proc.wait(timeout=JOB_CANCEL_GRACE_SECONDS)
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Worker for {task_key} did not stop within {JOB_CANCEL_GRACE_SECONDS}s, killing")
+                proc.kill()
+            return
+
+    def terminate_all(self):
+        """API 关闭时结束所有 worker 进程"""
+        with self.lock:
+            procs = list(self.processes.values())
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+
+
+job_executor = JobExecutor()
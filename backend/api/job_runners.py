@@ -0,0 +1,98 @@
+"""
+后台任务本体（爬虫 / PDF 索引）
+不依赖 TaskManager：日志通过 log_cb 回调输出，结果以 (status, metrics, error_msg) 返回，
+因此既可以在 API 进程的线程中运行，也可以由 job_worker.py 在独立进程中运行。
+"""
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+DB_PATH = os.getenv("DATABASE_PATH", "backend/crawler/forums.db")
+# http: HTTP 客户端 + lxml，遇到验证页才启动浏览器；selenium: 全程使用浏览器
+CRAWLER_ENGINE = os.getenv("CRAWLER_ENGINE", "http")
+
+
+def crawl_job(source_id: int, stop_event, log_cb):
+    """爬取单个数据源，完成后重新摄取向量"""
+    log_file = os.path.join(os.getcwd(), "backend/crawler/crawler.log")
+    with open(log_file, "a") as f:
+        f.write(f"\n--- Targeted Crawl ID {source_id} Started at {datetime.now()} ---\n")
+
+    specific_urls = None
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        c.execute("SELECT url FROM sources WHERE id = ?", (source_id,))
+        row = c.fetchone()
+        if row:
+            specific_urls = [row[0]]
+            log_cb(f"🎯 Targeted crawl requested for source ID {source_id}: {row[0]}")
+        conn.close()
+    except Exception as db_e:
+        log_cb(f"⚠️ Error fetching targeted URL: {db_e}")
+
+    # 1. Run Crawler
+    try:
+        sys.path.append(os.path.join(os.getcwd(), 'backend', 'crawler'))
+        log_cb(f"🚀 Background Crawler Started ({CRAWLER_ENGINE})...")
+        if CRAWLER_ENGINE == "selenium":
+            # 单个数据源时浏览器池只启动一个浏览器
+            from parallel_crawler import ParallelCrawler
+            crawler = ParallelCrawler(specific_urls=specific_urls)
+        else:
+            from http_crawler import HttpCrawler
+            crawler = HttpCrawler(specific_urls=specific_urls)
+        crawler.run(stop_event=stop_event, log_callback=log_cb)
+    except Exception as crawl_err:
+        log_cb(f"❌ Crawler Error: {crawl_err}")
+        return "error", None, str(crawl_err)
+
+    if stop_event.is_set():
+        log_cb("🛑 Task cancelled by user.", type="log")
+        return "cancelled", None, None
+
+    log_cb("✅ Background Crawler Finished.")
+
+    # 2. Trigger Vector Ingestion
+    try:
+        sys.path.append(os.path.join(os.getcwd(), 'backend', 'ingest'))
+        from vector_store import ingest_vectors
+        log_cb("🚀 Background Vector Ingestion Started...")
+        ingest_vectors()
+        log_cb("✅ Background Vector Ingestion Finished.")
+        return "finished", None, None
+    except Exception as ingest_err:
+        log_cb(f"❌ Ingestion Error: {ingest_err}")
+        return "error", None, str(ingest_err)
+
+
+def index_job(pdf_id: int, stop_event, log_cb):
+    """对单个 PDF 进行分块与向量化"""
+    log_cb(f"🚀 Starting PDF indexing for ID {pdf_id}")
+
+    from vector_store import ingest_pdf_chunks
+    success = ingest_pdf_chunks(pdf_id, log_callback=log_cb, stop_event=stop_event)
+
+    # 最终指标：页数 / 块数
+    from pdf_schema import get_pdf_by_id
+    pdf_record = get_pdf_by_id(pdf_id) or {}
+    final_metrics = {
+        "total_pages": pdf_record.get("total_pages"),
+        "total_chunks": pdf_record.get("total_chunks")
+    }
+
+    if stop_event.is_set():
+        log_cb("🛑 Indexing cancelled by user")
+        return "cancelled", final_metrics, None
+    if success:
+        log_cb("✅ Indexing completed successfully")
+        return "finished", final_metrics, None
+    log_cb("❌ Indexing failed")
+    return "error", final_metrics, pdf_record.get("error_message")
+
+
+JOB_RUNNERS = {
+    "crawl": crawl_job,
+    "index": index_job,
+}
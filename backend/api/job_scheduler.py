@@ -0,0 +1,159 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from metrics import metrics
+from task_manager import task_manager
+
+# 优先级：数值越小越先执行；同一优先级内按提交顺序（FIFO）
+PRIORITIES = {
+    "interactive": 0,  # 用户单独触发的单个 PDF 索引
+    "normal": 1,       # 爬虫任务
+    "bulk": 2,         # 批量重建 / 重新摄取
+}
+
+# 每种任务类型同时运行的 worker 上限
+DEFAULT_WORKER_LIMITS = {
+    "crawl": int(os.getenv("JOB_MAX_WORKERS_CRAWL", "1")),
+    "index": int(os.getenv("JOB_MAX_WORKERS_INDEX", "1")),
+}
+
+# 没有历史数据时用于估算开始时间的默认任务时长（秒）
+DEFAULT_DURATION_SECONDS = {
+    "crawl": 1800.0,
+    "index": 300.0,
+}
+
+
+class JobScheduler:
+    """
+    有界、带优先级的后台任务调度器：
+    - 每种任务类型有独立的并发上限，超出的任务排队
+    - 队列按 (优先级, 提交顺序) 出队
+    - 排队中的任务通过 TaskManager 日志流收到队列位置和预计开始时间
+    """
+
+    def __init__(self, worker_limits: Dict[str, int] = None):
+        self.worker_limits = dict(worker_limits or DEFAULT_WORKER_LIMITS)
+        self.queues: Dict[str, List[tuple]] = {job_type: [] for job_type in self.worker_limits}
+        self.running: Dict[str, Dict[str, float]] = {job_type: {} for job_type in self.worker_limits}
+        self.avg_duration: Dict[str, float] = dict(DEFAULT_DURATION_SECONDS)
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def submit(self, task_key: str, job_type: str, target: Callable, args: tuple = (),
+               priority: str = "normal"):
+        """提交任务；有空闲 worker 时立即启动，否则排队"""
+        entry = (PRIORITIES.get(priority, PRIORITIES["normal"]), next(self.counter), task_key, target, args)
+        with self.lock:
+            heapq.heappush(self.queues[job_type], entry)
+            to_start = self._dequeue_ready_unlocked(job_type)
+        for item in to_start:
+            self._launch(job_type, *item)
+        self._publish_positions(job_type)
+
+    def cancel(self, task_key: str) -> bool:
+        """从队列中移除尚未开始的任务，返回是否移除成功"""
+        removed_type = None
+        with self.lock:
+            for job_type, queue in self.queues.items():
+                for i, entry in enumerate(queue):
+                    if entry[2] == task_key:
+                        queue.pop(i)
+                        heapq.heapify(queue)
+                        removed_type = job_type
+                        break
+                if removed_type:
+                    break
+        if removed_type:
+            self._publish_positions(removed_type)
+        return removed_type is not None
+
+    def _dequeue_ready_unlocked(self, job_type: str):
+        ready = []
+        limit = max(1, self.worker_limits.get(job_type, 1))
+        queue = self.queues[job_type]
+        while queue and len(self.running[job_type]) < limit:
+            _, _, task_key, target, args = heapq.heappop(queue)
+            self.running[job_type][task_key] = time.monotonic()
+            ready.append((task_key, target, args))
+        metrics.set_gauge("job_queue_depth", len(queue), job_type=job_type)
+        metrics.set_gauge("job_running", len(self.running[job_type]), job_type=job_type)
+        return ready
+
+    def _launch(self, job_type: str, task_key: str, target: Callable, args: tuple):
+        task_manager.mark_running(task_key)
+
+        def run():
+            try:
+                target(*args)
+            finally:
+                self._on_done(job_type, task_key)
+
+        threading.Thread(target=run, name=f"job-{task_key}", daemon=True).start()
+
+    def _on_done(self, job_type: str, task_key: str):
+        with self.lock:
+            started = self.running[job_type].pop(task_key, None)
+            if started is not None:
+                duration = time.monotonic() - started
+                self.avg_duration[job_type] = 0.7 * self.avg_duration[job_type] + 0.3 * duration
+            to_start = self._dequeue_ready_unlocked(job_type)
+        for item in to_start:
+            self._launch(job_type, *item)
+        self._publish_positions(job_type)
+
+    def _estimate_unlocked(self, job_type: str):
+        """模拟 worker 依次空闲，估算每个排队任务的 (task_key, 位置, 预计开始秒数)"""
+        now = time.monotonic()
+        avg = self.avg_duration.get(job_type, 300.0)
+        limit = max(1, self.worker_limits.get(job_type, 1))
+        free_at = sorted(max(0.0, avg - (now - started)) for started in self.running[job_type].values())
+        free_at += [0.0] * (limit - len(free_at))
+        heapq.heapify(free_at)
+
+        estimates = []
+        for position, entry in enumerate(sorted(self.queues[job_type]), start=1):
+            start_in = heapq.heappop(free_at)
+            estimates.append((entry[2], position, start_in))
+            heapq.heappush(free_at, start_in + avg)
+        return estimates
+
+    def _publish_positions(self, job_type: str):
+        with self.lock:
+            estimates = self._estimate_unlocked(job_type)
+        for task_key, position, start_in in estimates:
+            eta = datetime.now() + timedelta(seconds=start_in)
+            task_manager.add_log(
+                task_key,
+                f"⏳ Queued: position {position}, estimated start in ~{int(start_in)}s",
+                type="queue",
+                data={
+                    "position": position,
+                    "estimated_start_seconds": int(start_in),
+                    "estimated_start": eta.isoformat(timespec="seconds")
+                }
+            )
+
+    def snapshot(self) -> dict:
+        """当前各类型的运行 / 排队情况"""
+        with self.lock:
+            result = {}
+            for job_type in self.worker_limits:
+                result[job_type] = {
+                    "limit": self.worker_limits[job_type],
+                    "running": list(self.running[job_type].keys()),
+                    "queued": [
+                        {"task_key": key, "position": position, "estimated_start_seconds": int(start_in)}
+                        for key, position, start_in in self._estimate_unlocked(job_type)
+                    ],
+                    "avg_duration_seconds": round(self.avg_duration[job_type], 1)
+                }
+            return result
+
+
+job_scheduler = JobScheduler()
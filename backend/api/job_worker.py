@@ -0,0 +1,62 @@
+"""
+独立任务进程脚本
+被 JobExecutor 在 process 模式下通过 subprocess 调用：
+    python job_worker.py <job_type> <target_id>
+
+IPC 协议（每行一个 JSON）：
+- stdout -> 父进程: {"event": "log", ...} / {"event": "result", ...}
+- stdin  <- 父进程: "stop" 表示取消；stdin 关闭（父进程退出）同样视为取消
+任务自身的 print 输出被重定向到 stderr，不会污染 IPC 通道。
+"""
+import json
+import os
+import sys
+import threading
+
+# 与 main.py 相同的模块搜索路径（工作目录由父进程继承）
+sys.path.append(os.path.join(os.getcwd(), 'backend', 'database'))
+sys.path.append(os.path.join(os.getcwd(), 'backend', 'ingest'))
+sys.path.append(os.path.join(os.getcwd(), 'backend', 'crawler'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    job_type, target_id = sys.argv[1], int(sys.argv[2])
+
+    # 保留原 stdout 作为 IPC 通道，之后 fd 1 指向 stderr（包括 Chrome 等孙进程）
+    ipc = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    ipc_lock = threading.Lock()
+
+    def send(event: dict):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with ipc_lock:
+            ipc.write(line + "\n")
+            ipc.flush()
+
+    stop_event = threading.Event()
+
+    def watch_stdin():
+        for line in sys.stdin:
+            if line.strip() == "stop":
+                break
+        stop_event.set()
+
+    threading.Thread(target=watch_stdin, name="job-worker-stdin", daemon=True).start()
+
+    def log_cb(msg, type="log", data=None):
+        send({"event": "log", "message": msg, "type": type, "data": data})
+
+    from job_runners import JOB_RUNNERS
+
+    try:
+        status, metrics, error_msg = JOB_RUNNERS[job_type](target_id, stop_event, log_cb)
+    except Exception as e:
+        status, metrics, error_msg = "error", None, str(e)
+    send({"event": "result", "status": status, "metrics": metrics, "error": error_msg})
+    ipc.close()
+
+
+if __name__ == "__main__":
+    main()
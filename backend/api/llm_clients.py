@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 长连接池配置：每个 provider 一个 client，复用 TCP/TLS 连接
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "600"))  # 10 minutes timeout for local models
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+
+# 本地 Ollama 预热：启动时加载模型，并定期 ping 防止被卸载（Ollama 默认 5 分钟空闲卸载）
+LLM_WARMUP = os.getenv("LLM_WARMUP", "false").lower() in ("1", "true", "yes")
+LLM_WARMUP_INTERVAL = float(os.getenv("LLM_WARMUP_INTERVAL", "240"))
+
+
+def resolve_llm_config(llm_provider: str) -> Tuple[str, str, str]:
+    """返回指定 provider 的 (api_key, base_url, model)"""
+    if llm_provider == "local":
+        # Use Ollama (local)
+        api_key = os.getenv("OPENAI_API_KEY", "ollama")
+        base_url = os.getenv("OPENAI_BASE_URL", "http://localhost:11434/v1")
+        model = os.getenv("OPENAI_MODEL", "llama3")
+    elif llm_provider == "deepseek":
+        # Use DeepSeek (via OpenAI-compatible API)
+        api_key = os.getenv("DEEPSEEK_API_KEY", "")
+        base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+        model = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+
+        if not api_key:
+            raise ValueError("DEEPSEEK_API_KEY not configured in environment variables")
+    else:
+        # Use OpenAI (cloud)
+        api_key = os.getenv("OPENAI_API_KEY", "")
+        base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+        model = os.getenv("OPENAI_MODEL", "gpt-4")
+
+    if not api_key and llm_provider == "cloud":
+        raise ValueError("OpenAI API key not configured")
+
+    return api_key, base_url, model
+
+
+class LLMClientPool:
+    """
+    每个 provider 持有一个长期存活的 AsyncOpenAI client。
+    底层 httpx 连接池开启 keep-alive，避免每次请求都重新建立 TLS 连接。
+    """
+
+    def __init__(self):
+        self.configs: Dict[str, Tuple[str, str, str]] = {}
+        self.async_clients: Dict[str, object] = {}
+        self.lock = threading.Lock()
+        self.warmup_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def normalize(llm_provider: str) -> str:
+        # 与原有逻辑一致：未知 provider 一律按 OpenAI cloud 处理
+        return llm_provider if llm_provider in ("local", "deepseek") else "cloud"
+
+    def configure(self):
+        """启动时从环境变量读取各 provider 配置；未配置密钥的 provider 在首次使用时报错"""
+        with self.lock:
+            for provider in ("local", "deepseek", "cloud"):
+                try:
+                    self.configs[provider] = resolve_llm_config(provider)
+                except ValueError as e:
+                    logger.info(f"LLM provider '{provider}' not configured: {e}")
+
+    def get_config(self, llm_provider: str) -> Tuple[str, str, str]:
+        provider = self.normalize(llm_provider)
+        with self.lock:
+            config = self.configs.get(provider)
+        if config is None:
+            # 未在启动时配置成功：重新解析，缺少密钥时抛出与原先相同的 ValueError
+            config = resolve_llm_config(provider)
+            with self.lock:
+                self.configs[provider] = config
+        return config
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+        )
+
+    def get_async_client(self, llm_provider: str):
+        """返回 provider 对应的 AsyncOpenAI client（绑定到服务进程的事件循环）"""
+        provider = self.normalize(llm_provider)
+        api_key, base_url, _ = self.get_config(provider)
+        with self.lock:
+            client = self.async_clients.get(provider)
+            if client is None:
+                import httpx
+                from openai import AsyncOpenAI
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=LLM_TIMEOUT,
+                    http_client=httpx.AsyncClient(limits=self._limits(), timeout=LLM_TIMEOUT)
+                )
+                self.async_clients[provider] = client
+        return client
+
+    def get_model(self, llm_provider: str) -> str:
+        return self.get_config(llm_provider)[2]
+
+    async def ping(self, llm_provider: str = "local") -> bool:
+        """发送 1 token 的请求，让本地模型保持加载状态"""
+        try:
+            client = self.get_async_client(llm_provider)
+            await client.chat.completions.create(
+                model=self.get_model(llm_provider),
+                messages=[{"role": "user", "content": "ping"}],
+                max_tokens=1
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"LLM warm-up ping failed for '{llm_provider}': {e}")
+            return False
+
+    async def _keep_warm(self, llm_provider: str, interval: float):
+        while True:
+            ok = await self.ping(llm_provider)
+            if ok:
+                logger.info(f"LLM provider '{llm_provider}' is warm")
+            await asyncio.sleep(interval)
+
+    def start_warmup(self, llm_provider: str = "local", interval: float = LLM_WARMUP_INTERVAL):
+        """在启动阶段调用：后台加载本地模型并定期 ping"""
+        if self.warmup_task is None:
+            self.warmup_task = asyncio.create_task(self._keep_warm(llm_provider, interval))
+
+    async def aclose(self):
+        if self.warmup_task is not None:
+            self.warmup_task.cancel()
+            try:
+                await self.warmup_task
+            except asyncio.CancelledError:
+                pass
+            self.warmup_task = None
+
+        with self.lock:
+            async_clients = list(self.async_clients.values())
+            self.async_clients.clear()
+
+        for client in async_clients:
+            await client.close()
+
+
+llm_pool = LLMClientPool()
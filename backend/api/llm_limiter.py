@@ -0,0 +1,102 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from metrics import metrics
+
+# 每个 provider 的并发上限与等待队列长度，可通过环境变量覆盖：
+# LLM_MAX_CONCURRENCY_LOCAL / LLM_MAX_QUEUE_LOCAL 等
+DEFAULT_LIMITS = {
+    "local": (2, 16),
+    "deepseek": (8, 64),
+    "cloud": (8, 64),
+}
+
+
+class ProviderBusyError(Exception):
+    """等待队列已满，调用方应返回 503 并带上 Retry-After"""
+
+    def __init__(self, provider: str, retry_after: int):
+        super().__init__(f"LLM provider '{provider}' is busy, retry after {retry_after}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class ProviderLimiter:
+    """单个 provider 的并发闸门：最多 max_concurrency 个生成同时进行，最多 max_queue 个请求排队"""
+
+    def __init__(self, provider: str, max_concurrency: int, max_queue: int):
+        self.provider = provider
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.semaphore = None  # 在事件循环内惰性创建
+        self.active = 0
+        self.waiting = 0
+        self.avg_hold_seconds = 10.0  # 占用时长的指数滑动平均，用于估算 Retry-After
+
+    def _publish(self):
+        metrics.set_gauge("llm_queue_depth", self.waiting, provider=self.provider)
+        metrics.set_gauge("llm_active", self.active, provider=self.provider)
+
+    def retry_after(self) -> int:
+        rounds = (self.waiting + 1) / self.max_concurrency
+        return max(1, math.ceil(rounds * self.avg_hold_seconds))
+
+    def check_admission(self):
+        """不排队地检查是否还能接收请求，队列满时抛出 ProviderBusyError"""
+        if self.active >= self.max_concurrency and self.waiting >= self.max_queue:
+            metrics.inc("llm_rejected_total", provider=self.provider)
+            raise ProviderBusyError(self.provider, self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.check_admission()
+
+        self.waiting += 1
+        self._publish()
+        wait_start = time.monotonic()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            self._publish()
+        metrics.observe("llm_queue_wait_seconds", time.monotonic() - wait_start, provider=self.provider)
+
+        self.active += 1
+        self._publish()
+        hold_start = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - hold_start
+            self.avg_hold_seconds = 0.8 * self.avg_hold_seconds + 0.2 * held
+            self.active -= 1
+            self.semaphore.release()
+            self._publish()
+
+
+class LimiterRegistry:
+    def __init__(self):
+        self.limiters: Dict[str, ProviderLimiter] = {}
+
+    def get(self, provider: str) -> ProviderLimiter:
+        limiter = self.limiters.get(provider)
+        if limiter is None:
+            default_concurrency, default_queue = DEFAULT_LIMITS.get(provider, DEFAULT_LIMITS["cloud"])
+            suffix = provider.upper()
+            limiter = ProviderLimiter(
+                provider,
+                int(os.getenv(f"LLM_MAX_CONCURRENCY_{suffix}", default_concurrency)),
+                int(os.getenv(f"LLM_MAX_QUEUE_{suffix}", default_queue))
+            )
+            self.limiters[provider] = limiter
+        return limiter
+
+
+llm_limiters = LimiterRegistry()
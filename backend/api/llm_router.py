@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from llm_clients import llm_pool
+from llm_limiter import llm_limiters, ProviderBusyError
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 首 token 延迟 SLO：主 provider 在该时间内没有输出时，向备用 provider 发起对冲请求
+LLM_FALLBACK_PROVIDER = os.getenv("LLM_FALLBACK_PROVIDER", "")  # 例如 "deepseek"；为空表示不启用
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+
+class ProviderUnavailableError(ProviderBusyError):
+    """主备 provider 的熔断器都处于打开状态；与队列已满一样返回 503 + Retry-After（熔断剩余时间）"""
+
+    def __init__(self, provider: str, retry_after: int):
+        super().__init__(provider, retry_after)
+        self.args = (f"LLM provider '{provider}' is unavailable (circuit open), retry after {retry_after}s",)
+
+
+class CircuitBreaker:
+    """
+    provider 健康状态：连续失败 failure_threshold 次后打开，
+    reset_seconds 后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开。
+    试探请求没有结果（被取消 / 排队被拒）时，reset_seconds 后再放行下一个。
+    provider 自己的排队拒绝（ProviderBusyError）和对冲落败不计为失败。
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.provider = provider
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = 0.0
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == "open":
+            if now - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self.trial_started = now
+                logger.info(f"Circuit for '{self.provider}' half-open, sending trial request")
+                return True
+            return False
+        if self.state == "half_open":
+            # 试探请求仍在进行中：其余请求继续视为不可用
+            if now - self.trial_started >= self.reset_seconds:
+                self.trial_started = now
+                return True
+            return False
+        return True
+
+    def retry_after(self) -> int:
+        """距离下一次放行试探请求的秒数"""
+        since = self.opened_at if self.state == "open" else self.trial_started
+        return max(1, math.ceil(self.reset_seconds - (time.monotonic() - since)))
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit for '{self.provider}' closed")
+        self.state = "closed"
+        self.failures = 0
+        metrics.set_gauge("llm_circuit_open", 0, provider=self.provider)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit for '{self.provider}' opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            metrics.set_gauge("llm_circuit_open", 1, provider=self.provider)
+        metrics.inc("llm_provider_failures_total", provider=self.provider)
+
+
+class LLMRouter:
+    """
+    带延迟 SLO 的 LLM 路由：
+    - 主 provider 熔断时直接走备用 provider
+    - 主 provider 超过 hedge_after 秒没有首 token 时，同时向备用 provider 发起请求，取先出 token 的一路
+    - 主 provider 在首 token 前报错时切换到备用 provider
+    """
+
+    def __init__(self, fallback_provider: str = LLM_FALLBACK_PROVIDER,
+                 hedge_after: float = LLM_HEDGE_AFTER_SECONDS):
+        self.fallback_provider = llm_pool.normalize(fallback_provider) if fallback_provider else None
+        self.hedge_after = hedge_after
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self.breakers:
+            self.breakers[provider] = CircuitBreaker(provider)
+        return self.breakers[provider]
+
+    async def _pump(self, provider: str, messages: List[dict], queue: asyncio.Queue):
+        """在 provider 的并发闸门内拉取流式输出，转发到共享队列"""
+        started = time.monotonic()
+        first = True
+        try:
+            client = llm_pool.get_async_client(provider)
+            model = llm_pool.get_model(provider)
+            async with llm_limiters.get(provider).slot():
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.3,
+                    stream=True
+                )
+                try:
+                    async for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if first:
+                                metrics.observe("llm_first_token_seconds", time.monotonic() - started, provider=provider)
+                                first = False
+                            await queue.put(("token", provider, chunk.choices[0].delta.content))
+                finally:
+                    # 被取消（对冲落败 / 客户端断开）时主动关闭 HTTP 响应，让上游立即停止生成
+                    await stream.close()
+            await queue.put(("end", provider, None))
+        except asyncio.CancelledError:
+            raise
+        except ProviderBusyError as e:
+            # 本地排队已满（背压），不代表 provider 故障
+            await queue.put(("busy", provider, e))
+        except Exception as e:
+            await queue.put(("error", provider, e))
+
+    async def stream(self, llm_provider: str, messages: List[dict]) -> AsyncIterator[str]:
+        primary = llm_pool.normalize(llm_provider)
+        fallback = self.fallback_provider if self.fallback_provider != primary else None
+
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        def launch(provider: str):
+            tasks[provider] = asyncio.create_task(self._pump(provider, messages, queue))
+
+        def can_fallback() -> bool:
+            return fallback is not None and fallback not in tasks and self.breaker(fallback).allow()
+
+        if self.breaker(primary).allow():
+            launch(primary)
+        elif can_fallback():
+            logger.info(f"Circuit for '{primary}' is open, routing to '{fallback}'")
+            metrics.inc("llm_failover_total", provider=fallback)
+            launch(fallback)
+        else:
+            raise ProviderUnavailableError(primary, self.breaker(primary).retry_after())
+
+        loop = asyncio.get_running_loop()
+        hedge_deadline = loop.time() + self.hedge_after
+        winner: Optional[str] = None
+        last_error: Optional[BaseException] = None
+
+        try:
+            # 1. 等待任一路产出首 token
+            while winner is None:
+                timeout = None
+                if fallback is not None and fallback not in tasks:
+                    timeout = max(0.0, hedge_deadline - loop.time())
+                try:
+                    kind, provider, value = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    if can_fallback():
+                        logger.info(f"No first token from '{primary}' within {self.hedge_after}s, hedging to '{fallback}'")
+                        metrics.inc("llm_hedged_total", provider=fallback)
+                        launch(fallback)
+                    else:
+                        hedge_deadline = float("inf")
+                    continue
+
+                if kind == "token":
+                    winner = provider
+                    yield value
+                elif kind == "end":
+                    winner = provider
+                    self.breaker(provider).record_success()
+                    return
+                else:
+                    last_error = value
+                    if kind == "busy":
+                        logger.info(f"LLM provider '{provider}' is busy: {value}")
+                    else:
+                        logger.warning(f"LLM provider '{provider}' failed before first token: {value}")
+                        self.breaker(provider).record_failure()
+                    del tasks[provider]
+                    if can_fallback():
+                        metrics.inc("llm_failover_total", provider=fallback)
+                        launch(fallback)
+                    elif not tasks:
+                        raise last_error
+
+            # 输掉竞速的一路：取消（只是慢，不计入熔断失败）
+            for provider, task in list(tasks.items()):
+                if provider != winner:
+                    task.cancel()
+                    metrics.inc("llm_hedge_lost_total", provider=provider)
+
+            # 2. 继续转发胜出一路的输出
+            while True:
+                kind, provider, value = await queue.get()
+                if provider != winner:
+                    continue
+                if kind == "token":
+                    yield value
+                elif kind == "end":
+                    self.breaker(winner).record_success()
+                    return
+                else:
+                    self.breaker(winner).record_failure()
+                    raise value
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def complete(self, llm_provider: str, messages: List[dict]) -> str:
+        """非流式调用：收集路由后的完整输出"""
+        parts = []
+        async for token in self.stream(llm_provider, messages):
+            parts.append(token)
+        return "".join(parts)
+
+
+llm_router = LLMRouter()
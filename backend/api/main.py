@@ -1,15 +1,14 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Literal
 import uvicorn
 import sqlite3
 import os
 import sys
-import threading
 import logging
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
+from datetime import datetime, date, time as dt_time
 from dotenv import load_dotenv
 import shutil
 
@@ -39,13 +38,45 @@ logger = logging.getLogger(__name__)
 DB_PATH = os.getenv("DATABASE_PATH", "backend/crawler/forums.db")
 CHROMA_PATH = os.getenv("CHROMA_PATH", "data/chroma_db")
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+RETRIEVE_CURSOR_TTL = float(os.getenv("RETRIEVE_CURSOR_TTL", "120"))
+RETRIEVE_MAX_CANDIDATES = int(os.getenv("RETRIEVE_MAX_CANDIDATES", "200"))
+
 
+class SearchFilters(BaseModel):
+    source_filter: Optional[str] = None  # "pdf", "forum", or None (all sources)
+    forum_sections: Optional[List[str]] = None  # 论坛版块 URL (threads.source_url)
+    date_field: Literal["last_post_date", "scraped_at"] = "last_post_date"
+    date_from: Optional[date] = None  # 含当天
+    date_to: Optional[date] = None  # 含当天
+    pdf_ids: Optional[List[int]] = None
 
-class SearchRequest(BaseModel):
+
+class SearchRequest(SearchFilters):
     query: str
     limit: int = 10
     llm_provider: Optional[str] = "local"  # "local", "cloud", or "deepseek"
-    source_filter: Optional[str] = None  # "pdf", "forum", or None (all sources)
+    stream_encoding: Literal["json", "compact"] = "json"  # 仅 /search/stream 使用
+
+
+class BatchSearchRequest(SearchFilters):
+    queries: List[str]
+    limit: int = 10
+    llm_provider: Optional[str] = "none"  # 批量默认只检索，需要答案时显式指定 provider
+    max_concurrency: int = 4  # 同时进行的 LLM 生成数量上限
+
+
+class RetrieveRequest(SearchFilters):
+    query: Optional[str] = None  # 第一页必填；使用 cursor 翻页时可省略
+    page_size: int = 10
+    max_candidates: int = 100  # 第一页一次性检索并缓存的候选数量
+    cursor: Optional[str] = None
+
+
+class RetrieveResponse(BaseModel):
+    results: List[dict]
+    total: int
+    next_cursor: Optional[str] = None
 
 
 class SearchResponse(BaseModel):
@@ -101,6 +132,15 @@ def get_collection():
     return collection
 
 
+from llm_clients import llm_pool, LLM_WARMUP
+from llm_limiter import llm_limiters, ProviderBusyError
+from metrics import metrics, monitor_event_loop_lag
+from coalescing import generation_flights
+from llm_router import llm_router
+from sse import answer_frame, coalesce_tokens, stop_on_disconnect, ClientDisconnected
+from retrieval import retrieval_service
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
@@ -109,9 +149,32 @@ async def lifespan(app: FastAPI):
     # Initialize PDF database tables
     import pdf_schema
     pdf_schema.init_pdf_tables()
+
+    # 任务历史表（上次进程退出时未完成的任务标记为 interrupted）
+    import job_schema
+    job_schema.init_job_tables()
+
+    # 每个 LLM provider 一个长连接 client；可选预热本地模型
+    llm_pool.configure()
+    if LLM_WARMUP:
+        llm_pool.start_warmup("local")
+
+    # 可选：预先启动爬虫浏览器，第一个 Selenium 爬取任务无需等待 Chrome 启动
+    if int(os.getenv("CRAWLER_DRIVER_PREWARM", "0")) > 0:
+        from driver_pool import driver_pool
+        driver_pool.start_prewarm()
+
+    # 事件循环延迟监控（/metrics: event_loop_lag_seconds）
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
     yield
-    # Shutdown logic (if any)
-    pass
+    # Shutdown logic
+    lag_monitor.cancel()
+    await llm_pool.aclose()
+    retrieval_service.shutdown()
+    job_executor.terminate_all()
+    # 浏览器池只有在爬虫运行过（或预热）时才会被导入
+    if "driver_pool" in sys.modules:
+        sys.modules["driver_pool"].driver_pool.shutdown()
 
 
 app = FastAPI(title="Avid MC RAG API", lifespan=lifespan)
@@ -176,7 +239,13 @@ def add_source(source: SettingsUpdate): # Overloading SettingsUpdate for URL
 from fastapi.responses import StreamingResponse
 import json
 import asyncio
-from task_manager import task_manager
+from task_manager import task_manager, job_key, event_id, CRAWL, INDEX
+import job_schema
+from job_scheduler import job_scheduler
+from job_executor import job_executor
+from retrieval_cache import CandidateCache, encode_cursor, decode_cursor
+
+candidate_cache = CandidateCache(ttl_seconds=RETRIEVE_CURSOR_TTL)
 
 import sys
 import os
@@ -185,83 +254,50 @@ import time
 from datetime import datetime
 
 
-def run_crawler_task(source_id: int):
-    try:
-        stop_event = task_manager.start_task(source_id)
+@app.post("/crawler/run")
+def trigger_crawler(source_id: int, priority: Literal["interactive", "normal", "bulk"] = "normal"):
+    task_key = job_key(CRAWL, source_id)
+    if task_manager.is_task_running(task_key):
+        return {"status": "error", "message": "Task already running for this source"}
 
-        def log_cb(msg, type="log", data=None):
-            task_manager.add_log(source_id, msg, type=type, data=data)
+    # 在返回之前登记任务，以便响应中带上 job_id
+    task_manager.start_task(task_key, status="queued")
 
-        log_file = os.path.join(os.getcwd(), "backend/crawler/crawler.log")
+    # 交给调度器：有空闲 worker 时立即运行（线程或独立进程，见 JOB_EXECUTION_MODE），否则排队
+    job_scheduler.submit(task_key, CRAWL, job_executor.run, args=(task_key, CRAWL, source_id), priority=priority)
+    return {
+        "status": "started",
+        "message": f"Crawler started for source {source_id}",
+        "job_id": task_manager.get_job_id(task_key)
+    }
 
-        with open(log_file, "a") as f:
-            f.write(f"\n--- Targeted Crawl ID {source_id} Started at {datetime.now()} ---\n")
-            f.flush()
 
-            specific_urls = None
-            try:
-                conn = sqlite3.connect(DB_PATH)
-                c = conn.cursor()
-                c.execute("SELECT url FROM sources WHERE id = ?", (source_id,))
-                row = c.fetchone()
-                if row:
-                    specific_urls = [row[0]]
-                    log_cb(f"🎯 Targeted crawl requested for source ID {source_id}: {row[0]}")
-                conn.close()
-            except Exception as db_e:
-                log_cb(f"⚠️ Error fetching targeted URL: {db_e}")
-
-            # 1. Run Crawler
-            try:
-                sys.path.append(os.path.join(os.getcwd(), 'backend', 'crawler'))
-                from forum_crawler import AvidCrawler
-                log_cb("🚀 Background Crawler Started...")
-                crawler = AvidCrawler(specific_urls=specific_urls)
-                crawler.run(stop_event=stop_event, log_callback=log_cb)
-
-                if stop_event.is_set():
-                    log_cb("🛑 Task cancelled by user.", type="log")
-                    task_manager.finish_task(source_id, status="cancelled")
-                else:
-                    log_cb("✅ Background Crawler Finished.")
-
-                    # 2. Trigger Vector Ingestion
-                    try:
-                        sys.path.append(os.path.join(os.getcwd(), 'backend', 'ingest'))
-                        from vector_store import ingest_vectors
-                        log_cb("🚀 Background Vector Ingestion Started...")
-                        ingest_vectors()
-                        log_cb("✅ Background Vector Ingestion Finished.")
-                        task_manager.finish_task(source_id, status="finished")
-                    except Exception as ingest_err:
-                        log_cb(f"❌ Ingestion Error: {ingest_err}")
-                        task_manager.finish_task(source_id, status="error")
-            except Exception as crawl_err:
-                log_cb(f"❌ Crawler Error: {crawl_err}")
-                task_manager.finish_task(source_id, status="error")
-
-            # Allow some time for SSE to drain before cleanup
-            time.sleep(10)
-            task_manager.cleanup_task(source_id)
+def cancel_queued_job(task_key: str) -> bool:
+    """取消尚未开始的排队任务"""
+    if not job_scheduler.cancel(task_key):
+        return False
+    job_id = task_manager.get_job_id(task_key)
+    task_manager.add_log(task_key, "🛑 Queued job cancelled by user.")
+    task_manager.finish_task(task_key, status="cancelled")
+    task_manager.schedule_cleanup(task_key, job_id, delay=10)
+    return True
 
-    except Exception as e:
-        logger.error(f"Background Task Critical Error: {e}", exc_info=True)
 
+def parse_last_event_id(request: Request, last_event_id: Optional[str] = None) -> Optional[str]:
+    """浏览器自动重连时带 Last-Event-ID 请求头；手动重连可用 ?last_event_id= 传入（格式 "<job_id>:<seq>"）"""
+    header = request.headers.get("last-event-id")
+    if header and header.strip():
+        return header.strip()
+    return last_event_id
 
-@app.post("/crawler/run")
-def trigger_crawler(source_id: int):
-    if task_manager.is_task_running(source_id):
-        return {"status": "error", "message": "Task already running for this source"}
 
-    # Run in a separate thread to not block the API
-    thread = threading.Thread(target=run_crawler_task, args=(source_id,))
-    thread.start()
-    return {"status": "started", "message": f"Crawler started for source {source_id}"}
+def sse_event(job_id: int, seq: int, payload: dict) -> str:
+    return f"id: {event_id(job_id, seq)}\ndata: {json.dumps(payload)}\n\n"
 
 
-@app.get("/crawler/logs/{source_id}")
-async def stream_logs(source_id: int):
-    queue = task_manager.get_log_queue(source_id)
+def stream_task_logs(task_key: str, last_event_id: Optional[str] = None):
+    """把 TaskManager 的订阅者队列转换为 SSE 响应（事件到达即推送，无轮询），每个事件带 "<job_id>:<seq>" 形式的 id"""
+    queue = task_manager.get_log_queue(task_key, last_event_id=last_event_id)
     if not queue:
         async def empty_stream():
             yield "data: " + json.dumps({"type": "status", "message": "finished"}) + "\n\n"
@@ -269,33 +305,135 @@ async def stream_logs(source_id: int):
 
     async def log_generator():
         try:
-            from queue import Empty
+            # 1. 续传：先补发已写入 job_events 的较早事件，再补发内存中的事件
+            if queue.spilled:
+                job_id, after_seq, before_seq = queue.spilled
+                spilled = await asyncio.to_thread(job_schema.list_job_events, job_id, after_seq, before_seq)
+                for seq, payload in spilled:
+                    yield sse_event(job_id, seq, payload)
+            for seq, payload in queue.replay:
+                yield sse_event(queue.job_id, seq, payload)
+            queue.replay = []
+
+            # 2. 实时事件
             while True:
-                try:
-                    # Non-blocking get from threading.Queue
-                    msg = queue.get_nowait()
-                    if msg is None:
-                        yield "data: " + json.dumps({"type": "status", "message": "finished"}) + "\n\n"
-                        break
-                    yield "data: " + json.dumps(msg) + "\n\n"
-                except Empty:
-                    await asyncio.sleep(0.5)
+                msg = await queue.get()
+                if msg is None:
+                    yield "data: " + json.dumps({"type": "status", "message": "finished"}) + "\n\n"
+                    break
+                yield sse_event(queue.job_id, *msg)
         finally:
-            task_manager.remove_log_queue(source_id, queue)
+            task_manager.remove_log_queue(task_key, queue)
 
     return StreamingResponse(log_generator(), media_type="text/event-stream")
 
 
+@app.get("/crawler/logs/{source_id}")
+async def stream_logs(source_id: int, request: Request, last_event_id: Optional[str] = None):
+    return stream_task_logs(job_key(CRAWL, source_id), parse_last_event_id(request, last_event_id))
+
+
 @app.post("/crawler/stop/{source_id}")
 def stop_crawler(source_id: int):
-    if task_manager.is_task_running(source_id):
-        task_manager.stop_task(source_id)
+    task_key = job_key(CRAWL, source_id)
+    if cancel_queued_job(task_key):
+        return {"status": "success", "message": "Queued task cancelled"}
+    if task_manager.is_task_running(task_key):
+        task_manager.stop_task(task_key)
         return {"status": "success", "message": "Cancellation signal sent"}
     return {"status": "error", "message": "No active task found for this source"}
 
 
+SYSTEM_PROMPT = """You are an expert Avid Media Composer support assistant.
+                    Answer the user's question using ONLY the provided context snippets.
+                    If the answer is not in the context, say "I couldn't find a specific answer in the knowledge base."
+                    Keep the answer concise and professional.
+                    Always answer in Chinese (中文)."""
+
+
+def build_where(request: SearchFilters) -> Optional[dict]:
+    """根据请求构建 Chroma where 过滤条件，多个条件以 $and 组合"""
+    conditions = []
+
+    if request.source_filter:
+        conditions.append({"source": request.source_filter})
+
+    if request.forum_sections:
+        if len(request.forum_sections) == 1:
+            conditions.append({"source_url": request.forum_sections[0]})
+        else:
+            conditions.append({"source_url": {"$in": request.forum_sections}})
+
+    if request.pdf_ids:
+        if len(request.pdf_ids) == 1:
+            conditions.append({"pdf_id": request.pdf_ids[0]})
+        else:
+            conditions.append({"pdf_id": {"$in": request.pdf_ids}})
+
+    # 日期范围基于摄取时写入的数值时间戳字段 (*_ts)
+    date_key = f"{request.date_field}_ts"
+    if request.date_from:
+        start_ts = int(datetime.combine(request.date_from, dt_time.min).timestamp())
+        conditions.append({date_key: {"$gte": start_ts}})
+    if request.date_to:
+        end_ts = int(datetime.combine(request.date_to, dt_time.max).timestamp())
+        conditions.append({date_key: {"$lte": end_ts}})
+
+    if not conditions:
+        return None
+
+    logger.info(f"Searching with filters: {conditions}")
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def build_sources(docs: List[str], metas: List[dict]):
+    """将单个查询的检索结果转换为 (sources, context_text)"""
+    sources = []
+    context_text = ""
+
+    for i, doc in enumerate(docs):
+        meta = metas[i]
+
+        # 根据来源类型构建不同的数据
+        source_data = {
+            "title": meta.get('title', 'Unknown'),
+            "url": meta.get('url', '#'),
+            "snippet": doc[:200] + "..."
+        }
+
+        # 如果是 PDF 来源，添加额外元数据
+        if meta.get('source') == 'pdf':
+            source_data['filename'] = meta.get('filename', '')
+            source_data['page'] = meta.get('page', 0)
+            # PDF 的 URL 设为 #
+            source_data['url'] = '#'
+
+        sources.append(source_data)
+        context_text += f"---\nTitle: {meta.get('title')}\nContent: {doc}\n"
+
+    return sources, context_text
+
+
+def build_messages(query: str, context_text: str) -> List[dict]:
+    user_prompt = f"Context:\n{context_text}\n\nQuestion: {query}\n\nPlease answer in Chinese."
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def busy_response(e: ProviderBusyError):
+    return HTTPException(
+        status_code=503,
+        detail=f"LLM provider '{e.provider}' is busy. Please retry later.",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
 @app.post("/search", response_model=SearchResponse)
-def search(request: SearchRequest):
+async def search(request: SearchRequest):
     col = get_collection()
     if not col:
         raise HTTPException(status_code=500, detail="Search engine not initialized (Model downloading?)")
@@ -308,99 +446,37 @@ def search(request: SearchRequest):
         }
 
         # Add metadata filter if source_filter is specified
-        if request.source_filter:
-            query_params["where"] = {"source": request.source_filter}
-            logger.info(f"Searching with source filter: {request.source_filter}")
+        where = build_where(request)
+        if where:
+            query_params["where"] = where
 
-        results = col.query(**query_params)
+        # 向量检索是同步调用，放到专用线程池避免阻塞事件循环
+        results = await retrieval_service.query(col, **query_params)
 
         sources = []
         context_text = ""
 
         if results['documents']:
             # Flatten results
-            docs = results['documents'][0]
-            metas = results['metadatas'][0]
-
-            for i, doc in enumerate(docs):
-                meta = metas[i]
-
-                # 根据来源类型构建不同的数据
-                source_data = {
-                    "title": meta.get('title', 'Unknown'),
-                    "url": meta.get('url', '#'),
-                    "snippet": doc[:200] + "..."
-                }
-
-                # 如果是 PDF 来源，添加额外元数据
-                if meta.get('source') == 'pdf':
-                    source_data['filename'] = meta.get('filename', '')
-                    source_data['page'] = meta.get('page', 0)
-                    # PDF 的 URL 设为 #
-                    source_data['url'] = '#'
-
-                sources.append(source_data)
-                context_text += f"---\nTitle: {meta.get('title')}\nContent: {doc}\n"
+            sources, context_text = build_sources(results['documents'][0], results['metadatas'][0])
 
         # 2. LLM Generation
         if context_text:
             try:
-                from openai import OpenAI
-                import os
-
                 # Get LLM config from request or environment
                 llm_provider = request.llm_provider or os.getenv("LLM_PROVIDER", "local")
 
                 # Check if LLM is disabled
                 if llm_provider == "none":
                     answer = ""
-                elif llm_provider == "local":
-                    # Use Ollama (local)
-                    api_key = os.getenv("OPENAI_API_KEY", "ollama")
-                    base_url = os.getenv("OPENAI_BASE_URL", "http://localhost:11434/v1")
-                    model = os.getenv("OPENAI_MODEL", "llama3")
-                elif llm_provider == "deepseek":
-                    # Use DeepSeek (via OpenAI-compatible API)
-                    api_key = os.getenv("DEEPSEEK_API_KEY", "")
-                    base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
-                    model = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
-
-                    if not api_key:
-                        raise ValueError("DEEPSEEK_API_KEY not configured in environment variables")
                 else:
-                    # Use OpenAI (cloud)
-                    api_key = os.getenv("OPENAI_API_KEY", "")
-                    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-                    model = os.getenv("OPENAI_MODEL", "gpt-4")
-
-                if llm_provider != "none":
-                    if not api_key and llm_provider == "cloud":
-                        raise ValueError("OpenAI API key not configured")
-
-                    client = OpenAI(
-                        api_key=api_key,
-                        base_url=base_url,
-                        timeout=600.0  # 10 minutes timeout for local models
-                    )
-
-                    system_prompt = """You are an expert Avid Media Composer support assistant.
-                    Answer the user's question using ONLY the provided context snippets.
-                    If the answer is not in the context, say "I couldn't find a specific answer in the knowledge base."
-                    Keep the answer concise and professional.
-                    Always answer in Chinese (中文)."""
-
-                    user_prompt = f"Context:\n{context_text}\n\nQuestion: {request.query}\n\nPlease answer in Chinese."""
-
-                    completion = client.chat.completions.create(
-                        model=model,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        temperature=0.3
+                    # 经路由层生成：并发受 provider 闸门限制，慢/故障时对冲或切换到备用 provider
+                    answer = await llm_router.complete(
+                        llm_provider,
+                        build_messages(request.query, context_text)
                     )
-
-                    answer = completion.choices[0].message.content
+            except ProviderBusyError:
+                raise
             except Exception as llm_e:
                 logger.error(f"LLM generation error: {llm_e}", exc_info=True)
                 answer = "Found relevant threads but failed to generate AI summary. Please check the server logs."
@@ -412,148 +488,279 @@ def search(request: SearchRequest):
             "sources": sources
         }
 
+    except ProviderBusyError as busy:
+        raise busy_response(busy)
     except Exception as e:
         logger.error(f"Search error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Search operation failed. Please check the server logs.")
 
 
 @app.post("/search/stream")
-async def search_stream(request: SearchRequest):
+async def search_stream(request: SearchRequest, http_request: Request):
     """流式响应搜索端点，实时返回 LLM 生成的内容"""
+    request_start = time.perf_counter()
     col = get_collection()
     if not col:
         raise HTTPException(status_code=500, detail="Search engine not initialized (Model downloading?)")
 
+    # Get LLM config from request or environment
+    llm_provider = request.llm_provider or os.getenv("LLM_PROVIDER", "local")
+    limiter = None
+    model = None
+    if llm_provider != "none":
+        limiter = llm_limiters.get(llm_pool.normalize(llm_provider))
+        try:
+            model = llm_pool.get_model(llm_provider)
+        except ValueError:
+            model = None  # provider 配置错误，在流中以 error 事件返回
+        # 检索在响应头发出之后才完成，因此在推流之前先按问题做一次准入判断：
+        # 队列已满时直接返回 503（已有相同问题在生成、可能被合并的请求除外）
+        if model is None or not generation_flights.has_query(request.query, llm_pool.normalize(llm_provider), model):
+            try:
+                limiter.check_admission()
+            except ProviderBusyError as busy:
+                raise busy_response(busy)
+
+    # 1. Vector Search with optional source filter
+    query_params = {
+        "query_texts": [request.query],
+        "n_results": request.limit
+    }
+
+    # Add metadata filter if source_filter is specified
+    where = build_where(request)
+    if where:
+        query_params["where"] = where
+
+    # 2. LLM Generation with Streaming
+    async def generate_response():
+        try:
+            # 立即发送 ping，响应头和首字节不等待检索完成
+            yield f"data: {json.dumps({'type': 'ping'})}\n\n"
+            metrics.observe("search_stream_ttfb_seconds", time.perf_counter() - request_start)
+
+            # 检索在专用线程池执行，不阻塞事件循环
+            try:
+                results = await retrieval_service.query(col, **query_params)
+            except Exception as e:
+                logger.error(f"Search error: {e}", exc_info=True)
+                yield f"data: {json.dumps({'type': 'error', 'message': 'Search operation failed. Please check the server logs.'})}\n\n"
+                return
+
+            sources = []
+            context_text = ""
+
+            if results['documents']:
+                # Flatten results
+                sources, context_text = build_sources(results['documents'][0], results['metadatas'][0])
+
+            yield f"data: {json.dumps({'type': 'sources', 'data': sources})}\n\n"
+            metrics.observe("search_stream_sources_seconds", time.perf_counter() - request_start)
+
+            if not context_text:
+                yield f"data: {json.dumps({'type': 'answer', 'content': 'No relevant discussions found in the knowledge base.'})}\n\n"
+                yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                return
+
+            # Check if LLM is disabled
+            if llm_provider == "none":
+                yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                return
+
+            def produce_tokens():
+                # 异步流式生成（经路由层：对冲 / 熔断切换）
+                return llm_router.stream(llm_provider, build_messages(request.query, context_text))
+
+            compact = request.stream_encoding == "compact"
+            if model is None:
+                # 无法合并（配置错误等），直接生成以便把原始错误返回给客户端
+                async for content in stop_on_disconnect(coalesce_tokens(produce_tokens()), http_request):
+                    yield answer_frame(content, compact)
+            else:
+                # 相同问题 + 相同检索结果 + 相同模型 的进行中生成会被合并
+                source_ids = tuple(results['ids'][0]) if results.get('ids') else ()
+                flight_key = (request.query, source_ids, llm_pool.normalize(llm_provider), model)
+                generation = generation_flights.join(flight_key, produce_tokens)
+                try:
+                    # 按时间/字符数合并 token，减少帧数；客户端断开时停止订阅
+                    async for content in stop_on_disconnect(coalesce_tokens(generation.subscribe()), http_request):
+                        yield answer_frame(content, compact)
+                finally:
+                    # 最后一个订阅者离开时会取消上游生成
+                    generation_flights.leave(generation)
+
+            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+
+        except ClientDisconnected:
+            logger.info("SSE client disconnected during /search/stream")
+        except ProviderBusyError as busy:
+            yield f"data: {json.dumps({'type': 'error', 'message': str(busy), 'retry_after': busy.retry_after})}\n\n"
+        except Exception as e:
+            logger.error(f"Streaming error: {e}", exc_info=True)
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+
+    return StreamingResponse(generate_response(), media_type="text/event-stream")
+
+
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """批量搜索端点：一次编码、一次多查询检索，结果以 NDJSON 流式返回"""
+    col = get_collection()
+    if not col:
+        raise HTTPException(status_code=500, detail="Search engine not initialized (Model downloading?)")
+
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Too many queries (max {BATCH_MAX_QUERIES})")
+
     try:
-        # 1. Vector Search with optional source filter
+        # 1. 一次 encoder 调用 + 一次多查询 col.query
         query_params = {
-            "query_texts": [request.query],
+            "query_texts": request.queries,
             "n_results": request.limit
         }
 
-        # Add metadata filter if source_filter is specified
-        if request.source_filter:
-            query_params["where"] = {"source": request.source_filter}
-            logger.info(f"Searching with source filter: {request.source_filter}")
-
-        results = col.query(**query_params)
+        where = build_where(request)
+        if where:
+            query_params["where"] = where
 
-        sources = []
-        context_text = ""
+        results = await retrieval_service.query(col, **query_params)
+    except Exception as e:
+        logger.error(f"Batch search error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Search operation failed. Please check the server logs.")
 
-        if results['documents']:
-            # Flatten results
-            docs = results['documents'][0]
-            metas = results['metadatas'][0]
+    documents = results.get('documents') or []
+    metadatas = results.get('metadatas') or []
 
-            for i, doc in enumerate(docs):
-                meta = metas[i]
+    llm_provider = request.llm_provider or os.getenv("LLM_PROVIDER", "local")
+    semaphore = asyncio.Semaphore(max(1, request.max_concurrency))
 
-                # 根据来源类型构建不同的数据
-                source_data = {
-                    "title": meta.get('title', 'Unknown'),
-                    "url": meta.get('url', '#'),
-                    "snippet": doc[:200] + "..."
-                }
+    async def run_one(index: int, query: str):
+        docs = documents[index] if index < len(documents) else []
+        metas = metadatas[index] if index < len(metadatas) else []
+        sources, context_text = build_sources(docs, metas)
 
-                # 如果是 PDF 来源，添加额外元数据
-                if meta.get('source') == 'pdf':
-                    source_data['filename'] = meta.get('filename', '')
-                    source_data['page'] = meta.get('page', 0)
-                    # PDF 的 URL 设为 #
-                    source_data['url'] = '#'
+        item = {"index": index, "query": query, "sources": sources}
 
-                sources.append(source_data)
-                context_text += f"---\nTitle: {meta.get('title')}\nContent: {doc}\n"
+        if llm_provider == "none":
+            return item
+        if not context_text:
+            item["answer"] = "No relevant discussions found in the knowledge base."
+            return item
 
-        # 2. LLM Generation with Streaming
-        async def generate_response():
+        try:
+            async with semaphore:
+                item["answer"] = await llm_router.complete(llm_provider, build_messages(query, context_text))
+        except ProviderBusyError as busy:
+            item["error"] = str(busy)
+            item["retry_after"] = busy.retry_after
+        except Exception as llm_e:
+            logger.error(f"Batch LLM generation error (query {index}): {llm_e}", exc_info=True)
+            item["error"] = "Failed to generate AI summary. Please check the server logs."
+        return item
+
+    async def generate_ndjson():
+        if llm_provider != "none":
             try:
-                # 先发送 sources
-                yield f"data: {json.dumps({'type': 'sources', 'data': sources})}\n\n"
-                # 添加一个空的 yield 来触发立即刷新
-                yield f"data: {json.dumps({'type': 'ping'})}\n\n"
+                # 提前校验 provider 配置，避免每条查询都报同样的错误
+                llm_pool.get_config(llm_provider)
+            except Exception as e:
+                logger.error(f"Batch LLM setup error: {e}", exc_info=True)
+                yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+                return
 
-                if not context_text:
-                    yield f"data: {json.dumps({'type': 'answer', 'content': 'No relevant discussions found in the knowledge base.'})}\n\n"
-                    yield f"data: {json.dumps({'type': 'done'})}\n\n"
-                    return
+        tasks = [asyncio.create_task(run_one(i, q)) for i, q in enumerate(request.queries)]
+        try:
+            # 按完成顺序输出，每行一个 JSON
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                yield json.dumps({"type": "result", **item}, ensure_ascii=False) + "\n"
+            yield json.dumps({"type": "done", "count": len(tasks)}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
 
-                from openai import AsyncOpenAI
-                import os
+    return StreamingResponse(generate_ndjson(), media_type="application/x-ndjson")
 
-                # Get LLM config from request or environment
-                llm_provider = request.llm_provider or os.getenv("LLM_PROVIDER", "local")
 
-                # Check if LLM is disabled
-                if llm_provider == "none":
-                    yield f"data: {json.dumps({'type': 'done'})}\n\n"
-                    return
-
-                if llm_provider == "local":
-                    # Use Ollama (local)
-                    api_key = os.getenv("OPENAI_API_KEY", "ollama")
-                    base_url = os.getenv("OPENAI_BASE_URL", "http://localhost:11434/v1")
-                    model = os.getenv("OPENAI_MODEL", "llama3")
-                elif llm_provider == "deepseek":
-                    # Use DeepSeek (via OpenAI-compatible API)
-                    api_key = os.getenv("DEEPSEEK_API_KEY", "")
-                    base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
-                    model = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
-
-                    if not api_key:
-                        raise ValueError("DEEPSEEK_API_KEY not configured in environment variables")
-                else:
-                    # Use OpenAI (cloud)
-                    api_key = os.getenv("OPENAI_API_KEY", "")
-                    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-                    model = os.getenv("OPENAI_MODEL", "gpt-4")
-
-                if llm_provider != "none":
-                    if not api_key and llm_provider == "cloud":
-                        raise ValueError("OpenAI API key not configured")
-
-                    client = AsyncOpenAI(
-                        api_key=api_key,
-                        base_url=base_url,
-                        timeout=600.0  # 10 minutes timeout for local models
-                    )
+@app.post("/retrieve", response_model=RetrieveResponse)
+def retrieve(request: RetrieveRequest):
+    """仅检索端点：返回排序后的来源，不调用 LLM，支持游标分页"""
+    page_size = max(1, min(request.page_size, RETRIEVE_MAX_CANDIDATES))
 
-                    system_prompt = """You are an expert Avid Media Composer support assistant.
-                    Answer the user's question using ONLY the provided context snippets.
-                    If the answer is not in the context, say "I couldn't find a specific answer in the knowledge base."
-                    Keep the answer concise and professional.
-                    Always answer in Chinese (中文)."""
-
-                    user_prompt = f"Context:\n{context_text}\n\nQuestion: {request.query}\n\nPlease answer in Chinese."
-
-                    # 异步流式生成
-                    stream = await client.chat.completions.create(
-                        model=model,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        temperature=0.3,
-                        stream=True
-                    )
+    # 后续页：直接从缓存的候选列表切片，不再执行向量查询
+    if request.cursor:
+        try:
+            token, offset = decode_cursor(request.cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        candidates = candidate_cache.get(token)
+        if candidates is None:
+            raise HTTPException(status_code=410, detail="Cursor expired, please re-run the query")
+    else:
+        if not request.query:
+            raise HTTPException(status_code=400, detail="query is required when no cursor is given")
+
+        col = get_collection()
+        if not col:
+            raise HTTPException(status_code=500, detail="Search engine not initialized (Model downloading?)")
+
+        max_candidates = max(page_size, min(request.max_candidates, RETRIEVE_MAX_CANDIDATES))
+        where = build_where(request)
+        token = candidate_cache.make_token({
+            "query": request.query,
+            "where": where,
+            "n": max_candidates
+        })
+        offset = 0
+
+        candidates = candidate_cache.get(token)
+        if candidates is None:
+            try:
+                query_params = {
+                    "query_texts": [request.query],
+                    "n_results": max_candidates,
+                    "include": ["documents", "metadatas", "distances"]
+                }
+                if where:
+                    query_params["where"] = where
 
-                    async for chunk in stream:
-                        if chunk.choices[0].delta.content:
-                            content = chunk.choices[0].delta.content
-                            yield f"data: {json.dumps({'type': 'answer', 'content': content})}\n\n"
+                results = col.query(**query_params)
+            except Exception as e:
+                logger.error(f"Retrieve error: {e}", exc_info=True)
+                raise HTTPException(status_code=500, detail="Retrieve operation failed. Please check the server logs.")
+
+            ids = results['ids'][0] if results.get('ids') else []
+            docs = results['documents'][0] if results.get('documents') else []
+            metas = results['metadatas'][0] if results.get('metadatas') else []
+            distances = results['distances'][0] if results.get('distances') else []
+
+            candidates = [
+                {
+                    "id": ids[i],
+                    "distance": distances[i] if i < len(distances) else None,
+                    "metadata": metas[i] or {},
+                    "snippet": docs[i][:200] if docs[i] else ""
+                }
+                for i in range(len(ids))
+            ]
+            candidate_cache.put(token, candidates)
 
-                    yield f"data: {json.dumps({'type': 'done'})}\n\n"
+    page = candidates[offset:offset + page_size]
+    next_offset = offset + page_size
 
-            except Exception as e:
-                logger.error(f"Streaming error: {e}", exc_info=True)
-                yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+    return {
+        "results": page,
+        "total": len(candidates),
+        "next_cursor": encode_cursor(token, next_offset) if next_offset < len(candidates) else None
+    }
 
-        return StreamingResponse(generate_response(), media_type="text/event-stream")
 
-    except Exception as e:
-        logger.error(f"Search error: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Search operation failed. Please check the server logs.")
+@app.get("/metrics")
+def get_metrics():
+    """进程内指标快照（队列深度、等待时间等）"""
+    return metrics.snapshot()
 
 
 # ==================== PDF Management Routes ====================
@@ -679,78 +886,80 @@ def delete_pdf(pdf_id: int):
 
 
 @app.post("/pdf/{pdf_id}/index")
-def index_pdf(pdf_id: int):
+def index_pdf(pdf_id: int, priority: Literal["interactive", "normal", "bulk"] = "interactive"):
     """手动触发 PDF 索引（向量化）"""
     try:
+        task_key = job_key(INDEX, pdf_id)
+
         # 检查是否已有任务在运行
-        if task_manager.is_task_running(pdf_id):
+        if task_manager.is_task_running(task_key):
             return {"status": "error", "message": "Indexing already in progress"}
 
-        # 在后台线程中运行索引任务
-        def run_indexing():
-            try:
-                stop_event = task_manager.start_task(pdf_id)
+        task_manager.start_task(task_key, status="queued")
+        job_id = task_manager.get_job_id(task_key)
 
-                def log_cb(msg, type="log", data=None):
-                    task_manager.add_log(pdf_id, msg, type=type, data=data)
+        # 交给调度器：单个 PDF 的交互式索引优先于批量任务
+        job_scheduler.submit(task_key, INDEX, job_executor.run, args=(task_key, INDEX, pdf_id), priority=priority)
 
-                log_cb(f"🚀 Starting PDF indexing for ID {pdf_id}")
+        return {"status": "started", "message": f"Indexing started for PDF {pdf_id}", "job_id": job_id}
 
-                from vector_store import ingest_pdf_chunks
-                success = ingest_pdf_chunks(pdf_id, log_callback=log_cb)
+    except Exception as e:
+        logger.error(f"Error starting indexing: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to start indexing")
 
-                if stop_event.is_set():
-                    log_cb("🛑 Indexing cancelled by user")
-                    task_manager.finish_task(pdf_id, status="cancelled")
-                elif success:
-                    log_cb("✅ Indexing completed successfully")
-                    task_manager.finish_task(pdf_id, status="finished")
-                else:
-                    log_cb("❌ Indexing failed")
-                    task_manager.finish_task(pdf_id, status="error")
 
-                time.sleep(10)
-                task_manager.cleanup_task(pdf_id)
+@app.post("/pdf/indexing/stop/{pdf_id}")
+def stop_indexing(pdf_id: int):
+    """停止 PDF 索引：排队中的直接取消；运行中的在当前批次写入后停止，可再次索引从断点继续"""
+    task_key = job_key(INDEX, pdf_id)
+    if cancel_queued_job(task_key):
+        return {"status": "success", "message": "Queued indexing cancelled"}
+    if task_manager.is_task_running(task_key):
+        task_manager.stop_task(task_key)
+        return {"status": "success", "message": "Cancellation signal sent"}
+    return {"status": "error", "message": "No active indexing task found for this PDF"}
 
-            except Exception as e:
-                logger.error(f"Indexing task error: {e}", exc_info=True)
-                task_manager.finish_task(pdf_id, status="error")
 
-        thread = threading.Thread(target=run_indexing)
-        thread.start()
+@app.get("/pdf/indexing/progress/{pdf_id}")
+async def stream_indexing_progress(pdf_id: int, request: Request, last_event_id: Optional[str] = None):
+    """SSE: 流式传输索引进度（支持 Last-Event-ID 续传）"""
+    return stream_task_logs(job_key(INDEX, pdf_id), parse_last_event_id(request, last_event_id))
 
-        return {"status": "started", "message": f"Indexing started for PDF {pdf_id}"}
 
+# ==================== Job History Routes ====================
+
+@app.get("/jobs", response_model=List[dict])
+def get_jobs(job_type: Optional[str] = None, target_id: Optional[int] = None,
+             status: Optional[str] = None, limit: int = 50, offset: int = 0):
+    """查询爬虫 / 索引任务历史"""
+    try:
+        from job_schema import list_jobs
+        jobs = list_jobs(job_type=job_type, target_id=target_id, status=status,
+                         limit=max(1, min(limit, 500)), offset=max(0, offset))
+        active = task_manager.active_job_ids()
+        for job in jobs:
+            job["active"] = job["id"] in active
+        return jobs
     except Exception as e:
-        logger.error(f"Error starting indexing: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Failed to start indexing")
+        logger.error(f"Error fetching jobs: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to fetch job history")
 
 
-@app.get("/pdf/indexing/progress/{pdf_id}")
-async def stream_indexing_progress(pdf_id: int):
-    """SSE: 流式传输索引进度"""
-    queue = task_manager.get_log_queue(pdf_id)
-    if not queue:
-        async def empty_stream():
-            yield "data: " + json.dumps({"type": "status", "message": "finished"}) + "\n\n"
-        return StreamingResponse(empty_stream(), media_type="text/event-stream")
+@app.get("/jobs/queue")
+def get_job_queue():
+    """各任务类型的运行 / 排队情况与预计开始时间"""
+    return job_scheduler.snapshot()
 
-    async def log_generator():
-        try:
-            from queue import Empty
-            while True:
-                try:
-                    msg = queue.get_nowait()
-                    if msg is None:
-                        yield "data: " + json.dumps({"type": "status", "message": "finished"}) + "\n\n"
-                        break
-                    yield "data: " + json.dumps(msg) + "\n\n"
-                except Empty:
-                    await asyncio.sleep(0.5)
-        finally:
-            task_manager.remove_log_queue(pdf_id, queue)
 
-    return StreamingResponse(log_generator(), media_type="text/event-stream")
+@app.get("/jobs/{job_id}")
+def get_job_detail(job_id: int):
+    """获取单个任务详情"""
+    from job_schema import get_job
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["active"] = job_id in task_manager.active_job_ids()
+    return job
 
 
 if __name__ == "__main__":
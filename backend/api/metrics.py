@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+class Metrics:
+    """
+    进程内轻量指标：计数器、仪表盘和耗时分布（保留最近 N 个样本计算分位数）。
+    通过 /metrics 以 JSON 暴露，不依赖 Prometheus 客户端。
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.samples: Dict[str, deque] = {}
+        self.totals: Dict[str, list] = {}  # key -> [count, sum, max]
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=self.max_samples)
+                self.totals[key] = [0, 0.0, 0.0]
+            self.samples[key].append(value)
+            totals = self.totals[key]
+            totals[0] += 1
+            totals[1] += value
+            totals[2] = max(totals[2], value)
+
+    def timer(self, name: str, **labels):
+        """with metrics.timer("x_seconds"): ... 记录代码块耗时"""
+        return _Timer(self, name, labels)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            summaries = {}
+            for key, values in self.samples.items():
+                ordered = sorted(values)
+                count, total, max_value = self.totals[key]
+                summaries[key] = {
+                    "count": count,
+                    "avg": round(total / count, 6) if count else 0,
+                    "p50": round(ordered[len(ordered) // 2], 6) if ordered else 0,
+                    "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 6) if ordered else 0,
+                    "max": round(max_value, 6)
+                }
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "summaries": summaries
+            }
+
+
+class _Timer:
+    def __init__(self, registry: Metrics, name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+metrics = Metrics()
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """周期性测量事件循环延迟：sleep 实际醒来时间与预期时间之差"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        metrics.observe("event_loop_lag_seconds", lag)
+        metrics.set_gauge("event_loop_lag_last_seconds", round(lag, 6))
@@ -0,0 +1,37 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+# 向量检索（查询编码 + HNSW 搜索）专用线程池，不与 Starlette 默认线程池争抢 worker
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+
+
+class RetrievalService:
+    """在专用线程池中执行同步的 col.query，事件循环只负责 await 结果"""
+
+    def __init__(self, max_workers: int = RETRIEVAL_WORKERS):
+        self.max_workers = max_workers
+        self.executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="retrieval")
+        return self.executor
+
+    def _timed_query(self, col, query_params: dict):
+        with metrics.timer("retrieval_seconds"):
+            return col.query(**query_params)
+
+    async def query(self, col, **query_params):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self._timed_query, col, query_params)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+retrieval_service = RetrievalService()
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+
+class CandidateCache:
+    """
+    短期缓存检索候选列表，供 /retrieve 游标分页使用。
+    第一页执行一次向量查询并缓存全部候选，后续页直接切片，不再访问 ChromaDB。
+    """
+
+    def __init__(self, ttl_seconds: float = 120.0, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_token(params: dict) -> str:
+        raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+    def get(self, token: str) -> Optional[List[dict]]:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            expires_at, candidates = entry
+            if expires_at < now:
+                del self.entries[token]
+                return None
+            self.entries.move_to_end(token)
+            return candidates
+
+    def put(self, token: str, candidates: List[dict]):
+        with self.lock:
+            self.entries[token] = (time.monotonic() + self.ttl_seconds, candidates)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def encode_cursor(token: str, offset: int) -> str:
+    return f"{token}.{offset}"
+
+
+def decode_cursor(cursor: str):
+    """返回 (token, offset)，格式错误时抛出 ValueError"""
+    token, _, offset = cursor.partition(".")
+    if not token or not offset.isdigit():
+        raise ValueError(f"Malformed cursor: {cursor}")
+    return token, int(offset)
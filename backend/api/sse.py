@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator
+
+# token 合并策略：缓冲的文本每 SSE_FLUSH_INTERVAL_MS 毫秒或累计 SSE_FLUSH_CHARS 个字符发送一帧，先到先发
+# 两者都设为 0 时退化为每个 token 一帧
+SSE_FLUSH_INTERVAL_MS = float(os.getenv("SSE_FLUSH_INTERVAL_MS", "50"))
+SSE_FLUSH_CHARS = int(os.getenv("SSE_FLUSH_CHARS", "64"))
+
+# 客户端断开检测的轮询间隔（秒）
+SSE_DISCONNECT_POLL_SECONDS = float(os.getenv("SSE_DISCONNECT_POLL_SECONDS", "0.5"))
+
+
+class ClientDisconnected(Exception):
+    """SSE 客户端已断开连接"""
+
+
+def answer_frame(content: str, compact: bool = False) -> str:
+    """
+    编码一段回答文本。
+    json:    data: {"type": "answer", "content": "..."}
+    compact: event: answer + 原始文本（多行文本拆成多个 data 行，由 EventSource 还原换行）
+    """
+    if compact:
+        lines = content.split("\n")
+        return "event: answer\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+    return f"data: {json.dumps({'type': 'answer', 'content': content})}\n\n"
+
+
+async def coalesce_tokens(tokens: AsyncIterator[str],
+                          interval_ms: float = SSE_FLUSH_INTERVAL_MS,
+                          max_chars: int = SSE_FLUSH_CHARS) -> AsyncIterator[str]:
+    """把细碎的 token 合并成较大的文本块：距缓冲区第一个 token interval_ms 毫秒或满 max_chars 字符即输出"""
+    if interval_ms <= 0 and max_chars <= 0:
+        async for token in tokens:
+            yield token
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = tokens.__aiter__()
+    interval = interval_ms / 1000.0
+    buffer = []
+    size = 0
+    deadline = None
+    pending = None
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+
+            timeout = None
+            if buffer and interval > 0:
+                timeout = max(0.0, deadline - loop.time())
+
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # 到达时间阈值：发送已缓冲内容，继续等待同一个 pending
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+                continue
+
+            finished, pending = pending, None
+            try:
+                token = finished.result()
+            except StopAsyncIteration:
+                break
+
+            if not buffer:
+                deadline = loop.time() + interval
+            buffer.append(token)
+            size += len(token)
+
+            if max_chars > 0 and size >= max_chars:
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+
+
+async def _wait_for_disconnect(request, poll_interval: float):
+    while not await request.is_disconnected():
+        await asyncio.sleep(poll_interval)
+
+
+async def stop_on_disconnect(chunks: AsyncIterator[str], request,
+                             poll_interval: float = SSE_DISCONNECT_POLL_SECONDS) -> AsyncIterator[str]:
+    """
+    转发 chunks，同时监听客户端断开。断开时立即停止等待上游并抛出 ClientDisconnected，
+    上游迭代器会被关闭，从而让调用方在 finally 中释放生成任务。
+    """
+    iterator = chunks.__aiter__()
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request, poll_interval))
+    pending = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({pending, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if pending not in done:
+                raise ClientDisconnected()
+
+            finished, pending = pending, None
+            try:
+                chunk = finished.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        watcher.cancel()
+        if pending is not None:
+            # 先等被取消的 __anext__ 结束，否则 aclose() 会因生成器仍在运行而报错
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
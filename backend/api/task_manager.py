@@ -1,77 +1,427 @@
 import asyncio
+import logging
+import os
 import threading
-from typing import Dict, Optional, List, Set
-from queue import Queue
+import time
+from collections import deque
+from typing import Dict, Optional, List, Set, Tuple
+
+import job_schema
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 每个订阅者的队列上限，慢客户端超出后丢弃最旧的事件
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "1000"))
+# 进度写入任务表的最小间隔（秒），终态总会写入
+JOB_PROGRESS_PERSIST_SECONDS = float(os.getenv("JOB_PROGRESS_PERSIST_SECONDS", "2"))
+# 每个任务在内存中保留的最近事件数（新订阅者 / Last-Event-ID 续传回放用）
+LOG_HISTORY_SIZE = int(os.getenv("LOG_HISTORY_SIZE", "100"))
+# 挤出内存缓冲的事件是否写入 job_events 表，以及每批写入的条数
+JOB_EVENT_SPILL = os.getenv("JOB_EVENT_SPILL", "true").lower() == "true"
+JOB_EVENT_SPILL_BATCH = int(os.getenv("JOB_EVENT_SPILL_BATCH", "50"))
+# 写库持续失败时内存中最多积压的待写事件数，超出后丢弃最旧的
+JOB_EVENT_SPILL_MAX = int(os.getenv("JOB_EVENT_SPILL_MAX", "5000"))
+# progress 事件的最小发送间隔（毫秒）；间隔内的进度只保留最新一条，到期后发送；0 表示不合并
+PROGRESS_EVENT_INTERVAL_MS = float(os.getenv("PROGRESS_EVENT_INTERVAL_MS", "250"))
+
+CRAWL = "crawl"
+INDEX = "index"
+
+
+def job_key(job_type: str, target_id: int) -> str:
+    """带类型的任务键，例如 "crawl:3" / "index:3"，避免数据源与 PDF 的 ID 冲突"""
+    return f"{job_type}:{target_id}"
+
+
+def event_id(job_id: int, seq: int) -> str:
+    """SSE 事件 id："<job_id>:<seq>"。序号每次运行从 1 开始，带上 job_id 才能跨运行唯一"""
+    return f"{job_id}:{seq}"
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """解析 event_id 生成的 id，格式不对时返回 None（按新连接处理）"""
+    if not value:
+        return None
+    job_id, sep, seq = value.strip().partition(":")
+    if not sep or not job_id.isdigit() or not seq.isdigit():
+        return None
+    return int(job_id), int(seq)
+
+
+class LogSubscriber:
+    """
+    单个 SSE 订阅者：绑定到订阅时所在的事件循环，持有一个有界 asyncio.Queue。
+    工作线程通过 loop.call_soon_threadsafe 投递事件，事件到达即唤醒消费者，空闲时不占 CPU。
+    队列元素为 (seq, payload)，None 表示任务结束。
+    投递在 TaskManager 的锁外进行，并发写日志的线程可能乱序到达，这里按序号重排后再入队。
+    订阅前已发生的事件放在 replay（内存部分）和 spilled（需从 job_events 读取的序号区间）中，先于队列发送。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, job_id: int, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.loop = loop
+        self.job_id = job_id  # 订阅的那次运行，用于生成事件 id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.replay: List[tuple] = []
+        self.spilled: Optional[tuple] = None  # (job_id, after_seq, before_seq)
+        # 以下只在事件循环线程中访问
+        self.next_seq = 1  # 下一个应入队的序号（订阅时设为当前序号 + 1）
+        self.pending: Dict[int, dict] = {}  # 先于前面序号到达的事件
+        self.end_seq: Optional[int] = None  # 收到结束标记时的最后序号
+        self.ended = False
+
+    def _put_drop_oldest(self, item):
+        # 只在事件循环线程中执行
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+                metrics.inc("log_events_dropped_total")
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(item)
+
+    def _accept(self, item):
+        # 只在事件循环线程中执行；item 为 (seq, payload)，payload 为 None 表示任务在 seq 之后结束
+        seq, payload = item
+        if payload is None:
+            self.end_seq = seq
+        elif seq >= self.next_seq and not self.ended:
+            self.pending[seq] = payload
+        while self.next_seq in self.pending:
+            self._put_drop_oldest((self.next_seq, self.pending.pop(self.next_seq)))
+            self.next_seq += 1
+        if self.end_seq is not None and self.next_seq > self.end_seq and not self.ended:
+            self.ended = True
+            self.pending.clear()
+            self._put_drop_oldest(None)
+
+    def push(self, item):
+        """线程安全投递；item 为 (seq, payload)，payload 为 None 表示任务在 seq 之后结束"""
+        try:
+            self.loop.call_soon_threadsafe(self._accept, item)
+        except RuntimeError:
+            # 事件循环已关闭，订阅者已不存在
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
 
 class TaskManager:
-    def __init__(self):
-        self.tasks: Dict[int, dict] = {}
+    """
+    运行中任务的内存缓存（停止信号、订阅者、最近日志），
+    任务的持久状态（状态、时间戳、进度、最终指标）写入 SQLite jobs 表。
+    锁内只做记录（环形缓冲追加 + 订阅者快照），向订阅者投递在锁外进行，由订阅者按序号保证顺序；
+    高频的 progress 事件按 PROGRESS_EVENT_INTERVAL_MS 合并，只发送最新状态。
+    """
+
+    def __init__(self, progress_interval_ms: float = PROGRESS_EVENT_INTERVAL_MS):
+        self.tasks: Dict[str, dict] = {}
         self.lock = threading.Lock()
+        self.spill_lock = threading.Lock()
+        self.progress_interval = progress_interval_ms / 1000.0
 
-    def start_task(self, source_id: int):
+    def start_task(self, task_key: str, status: str = "running"):
+        """登记任务；由调度器排队的任务以 status="queued" 登记，开始执行时调用 mark_running"""
+        job_type, _, target_id = task_key.partition(":")
+        job_id = job_schema.create_job(job_type, int(target_id), status=status)
         with self.lock:
-            self.tasks[source_id] = {
+            self.tasks[task_key] = {
+                "job_id": job_id,
                 "stop_event": threading.Event(),
-                "consumers": set(),
-                "status": "running",
-                "history": []
+                "consumers": (),  # 写时复制的元组，锁外可直接遍历快照
+                "status": status,
+                "history": deque(maxlen=LOG_HISTORY_SIZE),  # [(seq, payload)]
+                "seq": 0,
+                "spill": deque(),  # 已挤出 history、等待写入 job_events 的事件
+                "spilled_any": False,
+                "started_at": time.monotonic(),
+                "last_persist": 0.0,
+                "progress": {},
+                "last_progress_emit": 0.0,
+                "pending_progress": None,
+                "progress_timer": None
             }
-            res = self.tasks[source_id]["stop_event"]
+            res = self.tasks[task_key]["stop_event"]
         return res
 
-    def stop_task(self, source_id: int):
+    def mark_running(self, task_key: str):
+        with self.lock:
+            task = self.tasks.get(task_key)
+            if task is None:
+                return
+            task["status"] = "running"
+            task["started_at"] = time.monotonic()
+            job_id = task["job_id"]
+            delivery = self._record_unlocked(task_key, "▶️ Job started", type="queue", data={"position": 0})
+        self._deliver(delivery)
+        job_schema.update_job(job_id, status="running")
+
+    def get_job_id(self, task_key: str) -> Optional[int]:
+        with self.lock:
+            task = self.tasks.get(task_key)
+            return task["job_id"] if task else None
+
+    def get_stop_event(self, task_key: str) -> Optional[threading.Event]:
+        with self.lock:
+            task = self.tasks.get(task_key)
+            return task["stop_event"] if task else None
+
+    def stop_task(self, task_key: str):
         with self.lock:
-            if source_id in self.tasks:
-                self.tasks[source_id]["stop_event"].set()
-                self.tasks[source_id]["status"] = "cancelling"
-                self._add_log_unlocked(source_id, "🛑 Cancellation signal sent...")
+            if task_key not in self.tasks:
+                return
+            self.tasks[task_key]["stop_event"].set()
+            self.tasks[task_key]["status"] = "cancelling"
+            job_id = self.tasks[task_key]["job_id"]
+            delivery = self._record_unlocked(task_key, "🛑 Cancellation signal sent...")
+        self._deliver(delivery)
+        job_schema.update_job(job_id, status="cancelling")
 
-    def get_log_queue(self, source_id: int) -> Optional[Queue]:
+    def get_log_queue(self, task_key: str, last_event_id: Optional[str] = None) -> Optional[LogSubscriber]:
+        """
+        必须在事件循环中调用（SSE 端点内），订阅者绑定到当前循环。
+        last_event_id 为客户端已收到的最后一个事件 id（"<job_id>:<seq>"），只回放其后的事件；
+        来自同一键的其他运行（job_id 不同）或格式不对的 id 按新连接处理。
+        """
+        loop = asyncio.get_running_loop()
         with self.lock:
-            if source_id not in self.tasks:
+            if task_key not in self.tasks:
                 return None
+            task = self.tasks[task_key]
+
+            resume = parse_event_id(last_event_id)
+            if resume is not None and (resume[0] != task["job_id"] or resume[1] > task["seq"]):
+                resume = None
+            after = resume[1] if resume else 0
+
+            subscriber = LogSubscriber(loop, task["job_id"])
+            subscriber.next_seq = task["seq"] + 1  # 之后的每个序号都会投递给该订阅者
+            in_memory = list(task["spill"]) + list(task["history"])
+            subscriber.replay = [event for event in in_memory if event[0] > after]
+            first_in_memory = in_memory[0][0] if in_memory else task["seq"] + 1
+            # 新连接只回放内存缓冲；续传时才补读已写入 job_events 的缺口
+            if resume is not None and task["spilled_any"] and after + 1 < first_in_memory:
+                subscriber.spilled = (task["job_id"], after, first_in_memory)
+
+            if task["status"] not in ("queued", "running", "cancelling"):
+                # 任务已结束但尚未清理：回放后直接结束
+                subscriber._accept((task["seq"], None))
+
+            task["consumers"] += (subscriber,)
+            return subscriber
+
+    def remove_log_queue(self, task_key: str, subscriber: LogSubscriber):
+        with self.lock:
+            if task_key in self.tasks:
+                task = self.tasks[task_key]
+                task["consumers"] = tuple(s for s in task["consumers"] if s is not subscriber)
+
+    def _record_unlocked(self, task_key: str, message: str, type: str = "log", data: dict = None):
+        """分配序号并写入历史环形缓冲，返回 ((seq, payload), 订阅者快照) 供锁外投递"""
+        task = self.tasks.get(task_key)
+        if task is None:
+            return None
+        payload = {"type": type, "message": message}
+        if data:
+            payload.update(data)
+        task["seq"] += 1
+        event = (task["seq"], payload)
+        history = task["history"]
+        if JOB_EVENT_SPILL and len(history) == history.maxlen:
+            spill = task["spill"]
+            if len(spill) >= JOB_EVENT_SPILL_MAX:
+                # 写库一直失败：不再无限积压，续传时这部分事件缺失
+                spill.popleft()
+                metrics.inc("job_events_spill_dropped_total")
+            spill.append(history[0])
+        history.append(event)
+        return event, task["consumers"]
+
+    @staticmethod
+    def _deliver(delivery):
+        if delivery is None:
+            return
+        event, consumers = delivery
+        for subscriber in consumers:
+            subscriber.push(event)
 
-            q = Queue()
-            for log in self.tasks[source_id]["history"]:
-                q.put(log)
+    def _spill(self, task_key: str, force: bool = False):
+        """把挤出内存缓冲的事件批量写入 job_events；写入完成后才从内存移除，期间续传仍可读到"""
+        with self.spill_lock:
+            with self.lock:
+                task = self.tasks.get(task_key)
+                if task is None or not task["spill"]:
+                    return
+                if not force and len(task["spill"]) < JOB_EVENT_SPILL_BATCH:
+                    return
+                job_id = task["job_id"]
+                batch = list(task["spill"])
+            try:
+                job_schema.add_job_events(job_id, batch)
+            except Exception as e:
+                logger.warning(f"Failed to spill job events: {e}")
+                return
+            with self.lock:
+                task["spilled_any"] = True
+                # 写库期间可能有最旧的事件因积压超限被丢弃，按序号而不是条数移除
+                spill = task["spill"]
+                while spill and spill[0][0] <= batch[-1][0]:
+                    spill.popleft()
 
-            self.tasks[source_id]["consumers"].add(q)
-            return q
+    def _coalesce_progress_unlocked(self, task_key: str, message, data: dict):
+        """
+        progress 事件限速：距上次发送不足间隔时只暂存最新一条，并确保有定时器在到期时发出。
+        返回需要立即投递的内容（或 None）。
+        """
+        task = self.tasks.get(task_key)
+        if task is None:
+            return None
+        now = time.monotonic()
+        wait = task["last_progress_emit"] + self.progress_interval - now
+        if wait > 0:
+            if task["pending_progress"] is not None:
+                metrics.inc("log_progress_coalesced_total")
+            task["pending_progress"] = (message, data)
+            if task["progress_timer"] is None:
+                timer = threading.Timer(wait, self._flush_progress, args=(task_key, task["job_id"]))
+                timer.daemon = True
+                task["progress_timer"] = timer
+                timer.start()
+            return None
+        task["last_progress_emit"] = now
+        return self._record_unlocked(task_key, message, type="progress", data=data)
 
-    def remove_log_queue(self, source_id: int, q: Queue):
+    def _take_pending_progress_unlocked(self, task_key: str):
+        task = self.tasks.get(task_key)
+        if task is None:
+            return None
+        if task["progress_timer"] is not None:
+            task["progress_timer"].cancel()
+            task["progress_timer"] = None
+        pending, task["pending_progress"] = task["pending_progress"], None
+        if pending is None:
+            return None
+        task["last_progress_emit"] = time.monotonic()
+        message, data = pending
+        return self._record_unlocked(task_key, message, type="progress", data=data)
+
+    def _flush_progress(self, task_key: str, job_id: int):
         with self.lock:
-            if source_id in self.tasks:
-                self.tasks[source_id]["consumers"].discard(q)
-
-    def _add_log_unlocked(self, source_id: int, message: str, type: str = "log", data: dict = None):
-        if source_id in self.tasks:
-            payload = {"type": type, "message": message}
-            if data:
-                payload.update(data)
-            self.tasks[source_id]["history"].append(payload)
-            if len(self.tasks[source_id]["history"]) > 100:
-                self.tasks[source_id]["history"].pop(0)
-            for q in self.tasks[source_id]["consumers"]:
-                q.put(payload)
-
-    def add_log(self, source_id: int, message: str, type: str = "log", data: dict = None):
+            task = self.tasks.get(task_key)
+            if task is None or task["job_id"] != job_id:
+                return
+            task["progress_timer"] = None
+            delivery = self._take_pending_progress_unlocked(task_key)
+        self._deliver(delivery)
+
+    def _progress_to_persist(self, task_key: str, message, type: str, data: dict):
+        """记录最新进度；达到写入间隔时返回 (job_id, progress) 供锁外写库"""
+        task = self.tasks.get(task_key)
+        if task is None:
+            return None
+
+        if type == "progress":
+            # 爬虫把进度放在 data 中，PDF 索引把进度字典作为 message 传入
+            source = data if data else (message if isinstance(message, dict) else {})
+            if "current" in source:
+                task["progress"]["current"] = source["current"]
+            if "total" in source:
+                task["progress"]["total"] = source["total"]
+        elif isinstance(message, str):
+            task["progress"]["message"] = message
+
+        now = time.monotonic()
+        if now - task["last_persist"] < JOB_PROGRESS_PERSIST_SECONDS:
+            return None
+        task["last_persist"] = now
+        return task["job_id"], dict(task["progress"])
+
+    def _persist_progress(self, pending):
+        if pending is None:
+            return
+        job_id, progress = pending
+        try:
+            job_schema.update_job(
+                job_id,
+                progress_current=progress.get("current"),
+                progress_total=progress.get("total"),
+                last_message=progress.get("message")
+            )
+        except Exception as e:
+            logger.warning(f"Failed to persist job progress: {e}")
+
+    def add_log(self, task_key: str, message: str, type: str = "log", data: dict = None):
         with self.lock:
-            self._add_log_unlocked(source_id, message, type, data)
+            if type == "progress" and self.progress_interval > 0:
+                delivery = self._coalesce_progress_unlocked(task_key, message, data)
+            else:
+                delivery = self._record_unlocked(task_key, message, type, data)
+            pending = self._progress_to_persist(task_key, message, type, data)
+        self._deliver(delivery)
+        self._persist_progress(pending)
+        if JOB_EVENT_SPILL:
+            self._spill(task_key)
 
-    def finish_task(self, source_id: int, status: str = "finished"):
+    def finish_task(self, task_key: str, status: str = "finished", job_metrics: dict = None, error_msg: str = None):
         with self.lock:
-            if source_id in self.tasks:
-                self.tasks[source_id]["status"] = status
-                for q in self.tasks[source_id]["consumers"]:
-                    q.put(None)
+            if task_key not in self.tasks:
+                return
+            task = self.tasks[task_key]
+            task["status"] = status
+            # 先发出暂存的最后一条进度，再发送结束标记
+            delivery = self._take_pending_progress_unlocked(task_key)
+            consumers = task["consumers"]
+            end = (task["seq"], None)  # 订阅者收齐此前的全部事件后才结束
+            job_id = task["job_id"]
+            progress = dict(task["progress"])
+            final_metrics = dict(job_metrics or {})
+            final_metrics["duration_seconds"] = round(time.monotonic() - task["started_at"], 1)
+
+        self._deliver(delivery)
+        for subscriber in consumers:
+            subscriber.push(end)
+        if JOB_EVENT_SPILL:
+            self._spill(task_key, force=True)
+
+        job_schema.update_job(
+            job_id,
+            status=status,
+            progress_current=progress.get("current"),
+            progress_total=progress.get("total"),
+            last_message=progress.get("message"),
+            metrics=final_metrics,
+            error_msg=error_msg
+        )
+
+    def cleanup_task(self, task_key: str, job_id: Optional[int] = None):
+        """从缓存移除任务并删除其 job_events；传入 job_id 时只移除该次运行，避免误删同键的新任务"""
+        with self.lock:
+            task = self.tasks.get(task_key)
+            if task is None or (job_id is not None and task["job_id"] != job_id):
+                return
+            del self.tasks[task_key]
+        if task["spilled_any"]:
+            try:
+                job_schema.delete_job_events(task["job_id"])
+            except Exception as e:
+                logger.warning(f"Failed to delete job events: {e}")
+
+    def schedule_cleanup(self, task_key: str, job_id: Optional[int] = None, delay: float = 10.0):
+        """延迟清理（留时间让 SSE 读完最后的事件），不占用调用线程"""
+        timer = threading.Timer(delay, self.cleanup_task, args=(task_key, job_id))
+        timer.daemon = True
+        timer.start()
 
-    def cleanup_task(self, source_id: int):
+    def is_task_running(self, task_key: str) -> bool:
+        """排队中或运行中都视为活跃，防止重复提交"""
         with self.lock:
-            if source_id in self.tasks:
-                del self.tasks[source_id]
+            return task_key in self.tasks and self.tasks[task_key]["status"] in ("queued", "running")
 
-    def is_task_running(self, source_id: int) -> bool:
+    def active_job_ids(self) -> Set[int]:
         with self.lock:
-            return source_id in self.tasks and self.tasks[source_id]["status"] == "running"
+            return {task["job_id"] for task in self.tasks.values()}
 
 task_manager = TaskManager()
@@ -1,7 +1,7 @@
 import sqlite3
 import os
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "forums.db")
+DB_PATH = os.getenv("DATABASE_PATH", os.path.join(os.path.dirname(__file__), "forums.db"))
 
 def init_db():
     print(f"Initializing database at {DB_PATH}")
@@ -48,6 +48,16 @@ def init_db():
         last_updated TEXT
     )''')
     
+    # Crawl cursors：每个数据源的翻页进度，用于续爬中断的深度回填
+    # last_page: 上次已处理到的页码（NULL 表示没有未完成的回填）
+    # last_full_pass: 最近一次完整爬完（到达末页或本地数据已完整）的时间
+    c.execute('''CREATE TABLE IF NOT EXISTS crawl_cursors (
+        source_url TEXT PRIMARY KEY,
+        last_page INTEGER,
+        last_full_pass TEXT,
+        updated_at TEXT
+    )''')
+
     # Initialize default sources if not exists
     default_sources = [
         # Professional Video Editing
@@ -0,0 +1,268 @@
+"""
+长期存活的 WebDriver 池
+- chromedriver 路径只解析一次（CHROMEDRIVER_PATH 或 ChromeDriverManager().install()），不再每个任务访问网络
+- 任务结束时浏览器归还到池中（保留 cookie / 验证通过状态），下一个任务直接取用，无需重新启动 Chrome
+- 取用与归还时做健康检查；加载页面数超过 CRAWLER_DRIVER_MAX_PAGES、进程内存超过
+  CRAWLER_DRIVER_MAX_RSS_MB 的浏览器会被关闭重建
+- 空闲超过 CRAWLER_DRIVER_IDLE_SECONDS 的浏览器由后台定时器关闭，任务结束后不会一直开着窗口
+池只在当前进程内有效：JOB_EXECUTION_MODE=process 时每个任务进程仍会启动自己的浏览器。
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+try:
+    import psutil
+except ImportError:  # 没有 psutil 时不做内存检查
+    psutil = None
+
+# 默认显示浏览器窗口，便于人工完成验证；服务器上可设为 true
+CRAWLER_HEADLESS = os.getenv("CRAWLER_HEADLESS", "false").lower() in ("1", "true", "yes")
+CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "")
+# 池中最多保留的空闲浏览器数
+CRAWLER_DRIVER_POOL_SIZE = int(os.getenv("CRAWLER_DRIVER_POOL_SIZE", os.getenv("CRAWLER_BROWSERS", "3")))
+CRAWLER_DRIVER_MAX_PAGES = int(os.getenv("CRAWLER_DRIVER_MAX_PAGES", "500"))
+CRAWLER_DRIVER_MAX_RSS_MB = float(os.getenv("CRAWLER_DRIVER_MAX_RSS_MB", "1500"))
+CRAWLER_DRIVER_IDLE_SECONDS = float(os.getenv("CRAWLER_DRIVER_IDLE_SECONDS", "1800"))
+# API 启动时预先启动的浏览器数（0 表示第一个任务时再启动）
+CRAWLER_DRIVER_PREWARM = int(os.getenv("CRAWLER_DRIVER_PREWARM", "0"))
+
+USER_AGENT = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class DriverPool:
+    def __init__(self, pool_size: int = CRAWLER_DRIVER_POOL_SIZE, max_pages: int = CRAWLER_DRIVER_MAX_PAGES,
+                 max_rss_mb: float = CRAWLER_DRIVER_MAX_RSS_MB, idle_seconds: float = CRAWLER_DRIVER_IDLE_SECONDS):
+        self.pool_size = pool_size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.idle_seconds = idle_seconds
+        self.idle: List[PooledDriver] = []  # 后进先出：优先取最近用过的
+        self.in_use: Dict[int, PooledDriver] = {}  # id(driver) -> record
+        self.lock = threading.Lock()
+        self.path_lock = threading.Lock()
+        self.driver_path: Optional[str] = None
+        self.stats = {"created": 0, "reused": 0, "recycled": 0, "reaped": 0}
+        self.reaper: Optional[threading.Timer] = None
+
+    # ---------- 创建 ----------
+
+    def _resolve_driver_path(self) -> str:
+        with self.path_lock:
+            if self.driver_path is None:
+                self.driver_path = CHROMEDRIVER_PATH or ChromeDriverManager().install()
+            return self.driver_path
+
+    def _create(self):
+        options = webdriver.ChromeOptions()
+        if CRAWLER_HEADLESS:
+            options.add_argument('--headless=new')
+        options.add_argument('--window-size=1920,1080')
+        options.add_argument(f'--user-agent={USER_AGENT}')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument("--disable-blink-features=AutomationControlled")
+        options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        options.add_experimental_option('useAutomationExtension', False)
+
+        driver = webdriver.Chrome(service=ChromeService(self._resolve_driver_path()), options=options)
+        driver.set_page_load_timeout(60)  # Increased timeout
+        driver.set_script_timeout(60)
+
+        # Execute script to hide webdriver property（对之后打开的所有页面生效，复用时无需重新注入）
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+            "source": """
+                Object.defineProperty(navigator, 'webdriver', {
+                    get: () => undefined
+                })
+            """
+        })
+        with self.lock:
+            self.stats["created"] += 1
+        return PooledDriver(driver)
+
+    # ---------- 检查 ----------
+
+    @staticmethod
+    def _healthy(record: PooledDriver) -> bool:
+        """浏览器仍可响应；顺便关闭多余的标签页（任务中途退出时可能遗留）"""
+        try:
+            driver = record.driver
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def _rss_mb(record: PooledDriver) -> Optional[float]:
+        """chromedriver 及其下所有 Chrome 进程的常驻内存（MB）"""
+        if psutil is None:
+            return None
+        try:
+            root = psutil.Process(record.driver.service.process.pid)
+            procs = [root] + root.children(recursive=True)
+            total = 0
+            for proc in procs:
+                try:
+                    total += proc.memory_info().rss
+                except psutil.Error:
+                    continue
+            return total / (1024 * 1024)
+        except Exception:
+            return None
+
+    def _worn_out(self, record: PooledDriver) -> Optional[str]:
+        """需要重建的原因，无需重建返回 None"""
+        if self.max_pages > 0 and record.pages >= self.max_pages:
+            return f"{record.pages} pages"
+        rss = self._rss_mb(record) if self.max_rss_mb > 0 else None
+        if rss is not None and rss >= self.max_rss_mb:
+            return f"{rss:.0f} MB"
+        return None
+
+    def _quit(self, record: PooledDriver):
+        try:
+            record.driver.quit()
+        except Exception:
+            pass
+
+    # ---------- 空闲回收 ----------
+
+    def _schedule_reap_unlocked(self):
+        """池中有空闲浏览器且还没有定时器时，在最早的一个到期时检查（调用方持有 self.lock）"""
+        if self.idle_seconds <= 0 or self.reaper is not None or not self.idle:
+            return
+        oldest = min(record.last_used for record in self.idle)
+        delay = max(0.0, oldest + self.idle_seconds - time.monotonic()) + 1.0
+        self.reaper = threading.Timer(delay, self.reap_idle)
+        self.reaper.daemon = True
+        self.reaper.start()
+
+    def reap_idle(self):
+        """关闭空闲超时的浏览器；仍有空闲浏览器时重新安排下一次检查"""
+        now = time.monotonic()
+        with self.lock:
+            self.reaper = None
+            expired = [record for record in self.idle if now - record.last_used > self.idle_seconds]
+            self.idle = [record for record in self.idle if record not in expired]
+            self.stats["reaped"] += len(expired)
+            self._schedule_reap_unlocked()
+        for record in expired:
+            self._quit(record)
+
+    # ---------- 取用 / 归还 ----------
+
+    def acquire(self):
+        """取一个可用的浏览器；池为空时新建"""
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                record = self.idle.pop() if self.idle else None
+            if record is None:
+                record = self._create()
+                break
+            if self.idle_seconds > 0 and now - record.last_used > self.idle_seconds:
+                self._quit(record)
+                continue
+            if self._healthy(record):
+                with self.lock:
+                    self.stats["reused"] += 1
+                break
+            self._quit(record)
+
+        with self.lock:
+            self.in_use[id(record.driver)] = record
+        return record.driver
+
+    def release(self, driver, pages: int = 0):
+        """归还浏览器；pages 为本次使用中加载的页面数。不健康 / 超限 / 池已满时直接关闭"""
+        if driver is None:
+            return
+        with self.lock:
+            record = self.in_use.pop(id(driver), None)
+        if record is None:
+            record = PooledDriver(driver)
+        record.pages += pages
+        record.last_used = time.monotonic()
+
+        reason = self._worn_out(record)
+        if reason is None and self._healthy(record):
+            try:
+                driver.get("about:blank")  # 释放上一个页面占用的内存
+            except Exception:
+                reason = "unresponsive"
+        elif reason is None:
+            reason = "unresponsive"
+
+        with self.lock:
+            if reason is None and len(self.idle) < self.pool_size:
+                self.idle.append(record)
+                self._schedule_reap_unlocked()
+                return
+            if reason is not None:
+                self.stats["recycled"] += 1
+        self._quit(record)
+
+    def renew(self, driver, pages: int = 0):
+        """任务中途检查：浏览器超限时换一个新的，否则原样返回"""
+        with self.lock:
+            record = self.in_use.get(id(driver))
+        if record is None:
+            return driver
+        record.pages += pages
+        if self._worn_out(record) is None:
+            return driver
+        self.release(driver)
+        return self.acquire()
+
+    def start_prewarm(self, count: int = CRAWLER_DRIVER_PREWARM):
+        """后台启动 count 个浏览器放入池中"""
+        def _prewarm():
+            for _ in range(min(count, self.pool_size)):
+                try:
+                    record = self._create()
+                except Exception as e:
+                    print(f"⚠️ Browser prewarm failed: {e}")
+                    return
+                with self.lock:
+                    self.idle.append(record)
+                    self._schedule_reap_unlocked()
+        threading.Thread(target=_prewarm, name="driver-prewarm", daemon=True).start()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {**self.stats, "idle": len(self.idle), "in_use": len(self.in_use)}
+
+    def shutdown(self):
+        """关闭所有浏览器（API 退出时调用）"""
+        with self.lock:
+            if self.reaper is not None:
+                self.reaper.cancel()
+                self.reaper = None
+            records = self.idle + list(self.in_use.values())
+            self.idle = []
+            self.in_use = {}
+        for record in records:
+            self._quit(record)
+
+
+driver_pool = DriverPool()
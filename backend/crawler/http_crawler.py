@@ -0,0 +1,195 @@
+"""
+HTTP 优先的论坛爬虫
+列表页和帖子页通过连接池复用的 HTTP 客户端获取、用 lxml 解析；
+只有遇到验证页（CHALLENGE_MARKERS）时才启动 Selenium（AvidCrawler）处理，
+并把浏览器通过验证后的 cookie 同步回 HTTP 会话。
+"""
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db_schema import init_db
+from page_parser import is_challenge, parse_listing, parse_thread, CRAWLER_MAX_PAGES
+from page_walker import FetchCancelled, walk_source
+from rate_limit import HostRateLimiter, parse_retry_after, rate_limiter
+from thread_store import ThreadStore, load_source_urls
+
+DB_PATH = os.getenv("DATABASE_PATH", "backend/crawler/forums.db")
+# Fallback path logic
+if not os.path.exists(os.path.dirname(DB_PATH)):
+    DB_PATH = os.getenv("DATABASE_PATH", "forums.db")
+
+CRAWLER_HTTP_TIMEOUT = float(os.getenv("CRAWLER_HTTP_TIMEOUT", "30"))
+CRAWLER_HTTP_POOL_SIZE = int(os.getenv("CRAWLER_HTTP_POOL_SIZE", "10"))
+# 并发抓取帖子页的线程数（实际请求速率仍受 rate_limit 的令牌桶限制）
+CRAWLER_FETCH_WORKERS = int(os.getenv("CRAWLER_FETCH_WORKERS", "4"))
+# 429 / 5xx 时的最大重试次数
+CRAWLER_FETCH_RETRIES = int(os.getenv("CRAWLER_FETCH_RETRIES", "3"))
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# 403 通常意味着被防护拦截，交给浏览器处理；429 / 5xx 退避后重试
+CHALLENGE_STATUS_CODES = (403,)
+
+
+class HttpCrawler:
+    def __init__(self, specific_urls: list = None, session: requests.Session = None,
+                 limiter: HostRateLimiter = None, workers: int = CRAWLER_FETCH_WORKERS,
+                 max_pages: int = CRAWLER_MAX_PAGES):
+        self.source_urls = specific_urls or load_source_urls()
+        self.max_pages = max(1, max_pages)  # 每个数据源每次最多爬取的列表页数
+        self.session = session or self._create_session()
+        self.limiter = limiter or rate_limiter  # 默认使用进程内共享的限速器
+        self.workers = max(1, workers)
+        self.browser = None  # 按需创建的 AvidCrawler，仅用于验证页
+        self.browser_lock = threading.Lock()  # 浏览器只有一个，回退请求串行执行
+        self.browser_fallbacks = 0
+        self.store = None  # run() 期间的 ThreadStore（单写线程）
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=CRAWLER_HTTP_POOL_SIZE, pool_maxsize=CRAWLER_HTTP_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({
+            "User-Agent": USER_AGENT,
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.9"
+        })
+        return session
+
+    def fetch(self, url, log, stop_event=None):
+        """
+        经限速器获取页面（可在多个线程中并发调用）：
+        429 / 5xx 时退避重试，命中验证页时降低该 host 速率并交给浏览器
+        """
+        host = urlparse(url).netloc
+        for attempt in range(CRAWLER_FETCH_RETRIES + 1):
+            if not self.limiter.acquire(host, stop_event):
+                raise FetchCancelled()
+            try:
+                resp = self.session.get(url, timeout=CRAWLER_HTTP_TIMEOUT)
+            except requests.RequestException as e:
+                log(f"  ⚠️ HTTP fetch failed for {url}: {e}")
+                raise
+
+            if resp.status_code == 429 or resp.status_code >= 500:
+                delay = self.limiter.penalize(host, parse_retry_after(resp.headers.get("Retry-After")))
+                if attempt < CRAWLER_FETCH_RETRIES:
+                    log(f"  🐢 HTTP {resp.status_code} from {host}, backing off {delay:.1f}s (attempt {attempt + 1}/{CRAWLER_FETCH_RETRIES})")
+                    continue
+                resp.raise_for_status()
+
+            page_html = resp.text
+            if resp.status_code not in CHALLENGE_STATUS_CODES and not is_challenge(page_html):
+                resp.raise_for_status()
+                self.limiter.reward(host)
+                return page_html
+
+            self.limiter.penalize(host)
+            log(f"  🤖 Challenge detected on {url} (HTTP {resp.status_code}), falling back to browser")
+            with self.browser_lock:
+                return self._fetch_with_browser(url, log)
+
+    def fetch_listing(self, listing_url, page, log, stop_event=None):
+        """walk_source 的列表页策略"""
+        return parse_listing(self.fetch(listing_url, log, stop_event), listing_url)
+
+    def fetch_threads(self, threads, log, stop_event=None):
+        """
+        walk_source 的帖子抓取策略：并发抓取帖子页，按完成顺序产出
+        (url, title, last_post_date, question_content, error)。数据库写入由调用方在单一线程中完成。
+        """
+        def scrape(url):
+            return parse_thread(self.fetch(url, log, stop_event))
+
+        if threads:
+            log(f"  🔍 Scraping {len(threads)} threads with {self.workers} workers...")
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crawl-fetch")
+        try:
+            futures = {executor.submit(scrape, url): (url, title, last_post_date)
+                       for url, title, last_post_date in threads}
+            for future in as_completed(futures):
+                url, title, last_post_date = futures[future]
+                try:
+                    yield url, title, last_post_date, future.result(), None
+                except FetchCancelled:
+                    continue
+                except Exception as e:
+                    yield url, title, last_post_date, None, e
+                if stop_event and stop_event.is_set():
+                    break
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _fetch_with_browser(self, url, log):
+        if self.browser is None:
+            from forum_crawler import AvidCrawler
+            self.browser = AvidCrawler(specific_urls=[url])
+        self.browser_fallbacks += 1
+
+        driver = self.browser.driver
+        driver.get(url)
+        self.browser.check_for_captcha(max_wait_seconds=60)
+        page_html = driver.page_source
+
+        # 浏览器通过验证后，把 cookie 同步给 HTTP 会话，后续请求可以继续走 HTTP
+        for cookie in driver.get_cookies():
+            self.session.cookies.set(cookie["name"], cookie["value"],
+                                     domain=cookie.get("domain"), path=cookie.get("path", "/"))
+        return page_html
+
+    def run(self, stop_event=None, log_callback=None):
+        def log(msg, type="log", data=None):
+            if log_callback:
+                log_callback(msg, type=type, data=data)
+            else:
+                print(msg)
+
+        try:
+            log("🚀 Initializing Database...")
+            init_db() # Ensure tables exist
+
+            store = ThreadStore(DB_PATH)
+            self.store = store
+
+            for start_url in self.source_urls:
+                if stop_event and stop_event.is_set():
+                    log("🛑 Crawl stopped by user.")
+                    break
+
+                walk_source(start_url, store, self.fetch_listing, self.fetch_threads,
+                            max_pages=self.max_pages, stop_event=stop_event, log=log)
+
+            for host, stats in self.limiter.snapshot().items():
+                if stats["throttled"]:
+                    log(f"🐢 {host}: throttled {stats['throttled']} time(s), current rate {stats['rate']} req/s")
+            if self.browser_fallbacks:
+                log(f"🤖 Browser fallback used for {self.browser_fallbacks} page(s)")
+
+        except Exception as e:
+            log(f"❌ Crawler crashed: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            if self.store:
+                self.store.close()
+                self.store = None
+            self.session.close()
+            if self.browser:
+                self.browser.release_driver()
+            print("✅ Crawler workflow finished.")
+
+
+if __name__ == "__main__":
+    crawler = HttpCrawler()
+    crawler.run()
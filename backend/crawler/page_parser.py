@@ -0,0 +1,145 @@
+"""
+论坛页面解析（lxml）
+与 AvidCrawler 使用相同的 CSS 选择器，输入为完整的 HTML 文本（HTTP 响应或 driver.page_source），
+所有提取都在本地完成，不需要逐个元素访问 WebDriver。
+"""
+import os
+import re
+from urllib.parse import urljoin
+
+from lxml import html as lxml_html
+
+# 列表页第 N 页的地址：{url} 为数据源地址（第 1 页），{page} 为页码
+CRAWLER_PAGE_URL_TEMPLATE = os.getenv("CRAWLER_PAGE_URL_TEMPLATE", "{url}?PageIndex={page}")
+# 每个数据源每次最多爬取的列表页数（未爬完的回填由 crawl_cursors 记录，下次续爬）
+CRAWLER_MAX_PAGES = int(os.getenv("CRAWLER_MAX_PAGES", "20"))
+
+# 与 AvidCrawler.check_for_captcha 相同的验证页标记
+CHALLENGE_MARKERS = [
+    "cloudflare",
+    "captcha",
+    "verify you are human",
+    "human verification",
+    "security check",
+    "are you a human",
+    "just a moment"
+]
+
+
+def is_challenge(page_html: str) -> bool:
+    """页面是否为验证 / 人机检测页"""
+    lowered = (page_html or "").lower()
+    return any(marker in lowered for marker in CHALLENGE_MARKERS)
+
+
+# WebDriver .text 在这些元素前后换行
+BLOCK_TAGS = {"br", "p", "div", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre"}
+_BREAK = "\ue000"  # 私有区字符，仅作换行占位
+
+
+def element_text(el) -> str:
+    """近似 WebDriver 的 .text：块级元素和 <br> 处换行，其余空白（包括源码中的换行）合并为一个空格"""
+    for child in el.iter():
+        if child is el or not isinstance(child.tag, str) or child.tag not in BLOCK_TAGS:
+            continue
+        child.text = _BREAK + (child.text or "")
+        child.tail = _BREAK + (child.tail or "")
+    lines = (" ".join(line.split()) for line in el.text_content().split(_BREAK))
+    return "\n".join(line for line in lines if line)
+
+
+def page_url(source_url: str, page: int, template: str = CRAWLER_PAGE_URL_TEMPLATE) -> str:
+    """直接生成第 page 页的地址，翻页不依赖上一页的 DOM，可从任意页开始 / 续爬"""
+    if page <= 1:
+        return source_url
+    return template.format(url=source_url, page=page)
+
+
+def parse_document(page_html: str):
+    return lxml_html.fromstring(page_html)
+
+
+def _listing_rows(doc):
+    areas = doc.cssselect(".CommonListArea")
+    if len(areas) >= 2:
+        # 第二个 CommonListArea 是主题列表，第一个通常是公告 / 置顶
+        tables = areas[1].cssselect("table")
+        if tables:
+            return [row for row in tables[0].iter("tr") if "CommonListRow" in (row.get("class") or "")]
+        return areas[1].cssselect("tr[class*='CommonListRow']")
+    return doc.cssselect(".CommonListArea tr[class*='CommonListRow']")
+
+
+def parse_listing(page_html: str, base_url: str) -> dict:
+    """
+    解析列表页，返回:
+    {
+        "threads": [(url, title, last_post_date), ...],
+        "total_items": int,       # 分页区 "(37386 items)"，找不到为 0
+        "total_pages": int,       # 分页区 "Page 1 of 1870"，找不到为 0
+        "page_links": {2: url},   # 分页区中的页码链接
+        "area_count": int
+    }
+    """
+    doc = parse_document(page_html)
+
+    threads = []
+    for row in _listing_rows(doc):
+        links = row.cssselect("a.ForumName, a.ForumNameUnRead")
+        if not links:
+            continue
+        link = links[0]
+        href = link.get("href")
+        title = element_text(link)
+
+        last_post_date = ""
+        date_el = row.cssselect(".ForumLastPost")
+        if date_el:
+            parts = element_text(date_el[0]).strip().split(',')
+            # Result: "Jan 12 2024 4:00 PM" (omits the username part)
+            last_post_date = ','.join(parts[1:]).strip()
+
+        if href and title:
+            threads.append((urljoin(base_url, href), title, last_post_date))
+
+    total_items = 0
+    total_pages = 0
+    page_links = {}
+    paging = doc.cssselect(".CommonPagingArea")
+    if paging:
+        paging_text = element_text(paging[0])
+        match = re.search(r'\((\d+)\s+items\)', paging_text)
+        if match:
+            total_items = int(match.group(1))
+        match = re.search(r'Page\s+\d+\s+of\s+(\d+)', paging_text)
+        if match:
+            total_pages = int(match.group(1))
+        for a in paging[0].iter("a"):
+            label = (a.text_content() or "").strip()
+            if label.isdigit() and a.get("href"):
+                page_links[int(label)] = urljoin(base_url, a.get("href"))
+
+    return {
+        "threads": threads,
+        "total_items": total_items,
+        "total_pages": total_pages,
+        "page_links": page_links,
+        "area_count": len(doc.cssselect(".CommonListArea"))
+    }
+
+
+def has_next_page(listing: dict, current_page: int) -> bool:
+    """优先按 "Page X of N" 判断；没有该文字时看分页区是否有下一页的页码链接"""
+    if listing["total_pages"]:
+        return current_page < listing["total_pages"]
+    return (current_page + 1) in listing["page_links"]
+
+
+def parse_thread(page_html: str) -> str:
+    """解析帖子页，返回首帖（提问）正文"""
+    doc = parse_document(page_html)
+    bodies = doc.cssselect("div.ForumPostContentText")
+    if not bodies:
+        # Fallback selector just in case
+        bodies = doc.cssselect("td.ForumPostContentArea")
+    return element_text(bodies[0]) if bodies else ""
@@ -0,0 +1,209 @@
+"""
+单个数据源的列表页翻页 + 增量抓取 + 续爬游标（HTTP 与 Selenium 引擎共用）
+引擎只提供两个策略：
+- fetch_listing(listing_url, page, log, stop_event) -> parse_listing 的结果；
+  等待期间收到停止信号时抛出 FetchCancelled，其他异常视为列表页加载失败
+- scrape_threads(threads, log, stop_event) 按完成顺序产出 (url, title, last_post_date, question_content, error)
+翻页、增量判断、每页一个事务的写入和游标维护都在这里，两个引擎的行为保持一致。
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from page_parser import has_next_page, page_url, CRAWLER_MAX_PAGES
+
+# 连续多少个没有帖子的列表页后停止
+MAX_EMPTY_PAGES = 3
+
+
+class FetchCancelled(Exception):
+    """等待限速 / 页面加载期间收到停止信号"""
+
+
+def walk_source(start_url, store, fetch_listing, scrape_threads, max_pages: int = CRAWLER_MAX_PAGES,
+                stop_event=None, log=None) -> int:
+    """
+    爬取单个数据源，返回处理的帖子数。
+    写入通过 store（ThreadStore）交给单写线程，可由多个引擎 / 浏览器并行调用。
+    列表页地址由 page_url 直接生成；上次未完成的深度回填从 crawl_cursors 记录的页码继续。
+    """
+    if log is None:
+        def log(msg, type="log", data=None):
+            print(msg)
+
+    processed_count = 0
+
+    if stop_event and stop_event.is_set():
+        log("🛑 Crawl stopped by user.")
+        return processed_count
+
+    log(f"🎬 Starting crawl for source: {start_url}")
+
+    # 上次回填中断的位置：先从第 1 页检查新帖，进入回填阶段后直接跳到该页
+    try:
+        cursor = store.get_cursor(start_url)
+    except Exception as cursor_e:
+        log(f"  ⚠️ Failed to read crawl cursor: {cursor_e}")
+        cursor = {"last_page": None}
+    resume_page = cursor["last_page"] + 1 if cursor["last_page"] else None
+    if resume_page:
+        log(f"📌 Unfinished backfill: last run reached page {cursor['last_page']}")
+
+    total_items = 0
+    current_page = 1
+    pages_visited = 0
+    consecutive_empty_pages = 0
+    finished = False  # 分页区显示已到末页 / 数据完整（区别于用户停止、加载失败、异常空页和达到深度上限）
+    full_pass = False
+
+    while pages_visited < max_pages:
+        if stop_event and stop_event.is_set():
+            log("🛑 Crawl stopped by user while switching page.")
+            break
+
+        listing_url = page_url(start_url, current_page)
+        log(f"📄 Processing Page {current_page} - {listing_url}")
+        pages_visited += 1
+        try:
+            listing = fetch_listing(listing_url, current_page, log, stop_event)
+        except FetchCancelled:
+            log("🛑 Crawl stopped by user while switching page.")
+            break
+        except Exception as e:
+            # 列表页拿不到时不再猜测后续页码；游标保持不变，下次从这里重试
+            log(f"⚠️ Page load error: {e}")
+            break
+
+        if stop_event and stop_event.is_set():
+            log("🛑 Crawl stopped by user after page load.")
+            break
+
+        if not total_items and listing["total_items"]:
+            total_items = listing["total_items"]
+            log(f"📊 Total items found: {total_items}", type="progress", data={"current": processed_count, "total": total_items})
+
+        thread_links = listing["threads"]
+        next_exists = has_next_page(listing, current_page)
+        log(f"Found {len(thread_links)} threads on this page.")
+
+        # If no threads found on this page, try next page instead of stopping
+        if len(thread_links) == 0:
+            consecutive_empty_pages += 1
+            log(f"  ⚠️ No threads found on page {current_page}. (Consecutive empty pages: {consecutive_empty_pages}/{MAX_EMPTY_PAGES})")
+            if not (listing["total_pages"] or listing["page_links"]):
+                # 既没有帖子也没有分页区：验证页未通过 / 页面结构变化，按加载失败处理，游标保持不变
+                log(f"⚠️ Page {current_page} has no threads and no paging info (verification page or layout change?). Stopping crawl.")
+                break
+            if not next_exists:
+                log("  🛑 No more pages with threads. Stopping crawl.")
+                finished = True
+                break
+            if consecutive_empty_pages >= MAX_EMPTY_PAGES:
+                # 分页区显示还有后续页，不能确定已到末页，保留游标
+                log("  🛑 Too many consecutive empty pages. Stopping crawl.")
+                break
+            current_page += 1
+            continue
+
+        consecutive_empty_pages = 0
+
+        all_unchanged_on_page = True
+        to_scrape = []
+        # 整页的帖子一次查询
+        try:
+            known = store.get_threads([url for url, _, _ in thread_links])
+        except Exception as lookup_e:
+            log(f"  ⚠️ Failed to look up known threads: {lookup_e}")
+            known = {}
+
+        for url, title, last_post_date in thread_links:
+            if url in known:
+                db_last_date = known[url]
+                if db_last_date == last_post_date:
+                    log(f"  ⏭️ 没有更新 (Last Post: {last_post_date}): {title[:30]}...")
+                    processed_count += 1
+                    log("Progress update", type="progress", data={"current": processed_count, "total": total_items})
+                    continue
+                else:
+                    log(f"  🆕 发现新回复! ({db_last_date} -> {last_post_date})")
+
+            all_unchanged_on_page = False
+            to_scrape.append((url, title, last_post_date))
+
+        scraped = []  # 本页新抓取 / 有更新的帖子，页末与 source_url 回填一起写入
+        attempted = 0
+        for url, title, last_post_date, question_content, error in scrape_threads(to_scrape, log, stop_event):
+            attempted += 1
+            if error is not None:
+                log(f"  ⚠️ Error scraping thread {url}: {error}")
+                continue
+
+            scraped.append((url, title, question_content, last_post_date))
+            processed_count += 1
+            log("Progress update", type="progress", data={"current": processed_count, "total": total_items})
+            log(f"  ✅ Topic: {title}")
+
+        # Backfill source_url for ALL threads (unchanged or new) + 新帖写入 + 游标：每页一个事务
+        # 尚未跳转到续爬页码时保留原来的游标，避免被第 1 页覆盖；
+        # 页内中途停止时本页未处理完，游标只记到上一页（下次重新爬本页）
+        done_page = current_page if attempted == len(to_scrape) else current_page - 1
+        cursor_page = max(done_page, resume_page - 1) if resume_page else done_page
+        try:
+            store.save_page(start_url, [url for url, _, _ in thread_links], scraped,
+                            cursor_page=cursor_page if cursor_page >= 1 else None).result()
+        except Exception as save_e:
+            log(f"  ⚠️ Failed to save page {current_page}: {save_e}")
+
+        if stop_event and stop_event.is_set():
+            log("🛑 Crawl stopped by user.")
+            break
+
+        # If entire page is unchanged (all threads already in DB), check if we should stop
+        if all_unchanged_on_page:
+            should_continue = False
+            if total_items > 0:
+                try:
+                    local_count = store.count_source_threads(start_url)
+                    log(f"  📊 Local Count: {local_count} / Web Total: {total_items}")
+
+                    # If we have fewer items locally than on web, we might be missing old threads
+                    # Allow a buffer (e.g. 5) for sticky threads or deleted items
+                    if local_count < (total_items - 5):
+                        log(f"  ⚠️ Local data incomplete ({local_count} < {total_items}). Continuing crawl to find older threads...")
+                        should_continue = True
+                except Exception as count_e:
+                    log(f"  ⚠️ Failed to check local count: {count_e}")
+
+            if not should_continue:
+                log(f"  ✅ 当前页所有 {len(thread_links)} 条都已在数据库中且无更新，且数据量似乎完整，停止本源爬取。")
+                finished = True
+                full_pass = True
+                break
+
+            # 回填阶段：直接跳到上次中断的页码
+            if resume_page and resume_page > current_page + 1:
+                log(f"  ⏩ Resuming backfill at page {resume_page}")
+                current_page = resume_page
+                resume_page = None
+                continue
+
+        if not next_exists:
+            log(f"Page {current_page + 1} not found (end of list). Source complete.")
+            finished = True
+            full_pass = True
+            break
+        current_page += 1
+    else:
+        log(f"  ⏸️ Reached depth limit ({max_pages} pages). Next run resumes from page {current_page}.")
+
+    if not (stop_event and stop_event.is_set()):
+        try:
+            # 正常结束时清除续爬页码；达到深度上限 / 加载失败时保留，下次从该页继续
+            if finished:
+                store.finish_cursor(start_url, full_pass)
+            # Update last_updated in sources for this specific URL
+            store.mark_source_updated(start_url).result()
+        except Exception as update_err:
+            log(f"  ⚠️ Failed to update timestamp for {start_url}: {update_err}")
+
+    return processed_count
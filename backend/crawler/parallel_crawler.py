@@ -0,0 +1,127 @@
+"""
+多数据源并行爬取（Selenium）
+浏览器池中有 N 个 AvidCrawler（各自持有一个 WebDriver），从共享队列领取数据源并行爬取；
+所有写入经同一个 ThreadStore 的单写线程落库，所有页面加载经进程内共享的 rate_limiter 限速
+（浏览器数 / 并发任务数增加时总请求速率仍不超过 CRAWLER_MAX_RPS）。
+每个数据源的日志带 [来源] 前缀，进度事件汇总所有数据源后通过同一个 log_callback 发出。
+"""
+import os
+import queue
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db_schema import init_db
+from rate_limit import HostRateLimiter, rate_limiter
+from thread_store import ThreadStore, DB_PATH, load_source_urls
+
+CRAWLER_BROWSERS = int(os.getenv("CRAWLER_BROWSERS", "3"))
+
+
+def source_label(url: str) -> str:
+    """日志前缀：https://community.avid.com/forums/398.aspx -> 398.aspx"""
+    return url.rstrip("/").rsplit("/", 1)[-1] or url
+
+
+class ParallelCrawler:
+    def __init__(self, specific_urls: list = None, browsers: int = CRAWLER_BROWSERS,
+                 limiter: HostRateLimiter = None):
+        self.source_urls = specific_urls or load_source_urls()
+        self.browsers = max(1, min(browsers, len(self.source_urls)))
+        self.limiter = limiter or rate_limiter  # 所有浏览器及同进程的其他爬取任务共享
+        self.progress = {}  # source_url -> {"current", "total"}
+        self.lock = threading.Lock()
+
+    def run(self, stop_event=None, log_callback=None):
+        def log(msg, type="log", data=None):
+            if log_callback:
+                log_callback(msg, type=type, data=data)
+            else:
+                print(msg)
+
+        def source_log(start_url):
+            label = source_label(start_url)
+
+            def _log(msg, type="log", data=None):
+                if type == "progress":
+                    with self.lock:
+                        state = self.progress.setdefault(start_url, {"current": 0, "total": 0})
+                        state.update({k: v for k, v in (data or {}).items() if k in ("current", "total")})
+                        aggregate = {
+                            "current": sum(s["current"] for s in self.progress.values()),
+                            "total": sum(s["total"] for s in self.progress.values()),
+                            "source": start_url,
+                            "source_current": state["current"],
+                            "source_total": state["total"]
+                        }
+                    log(f"[{label}] {msg}", type="progress", data=aggregate)
+                else:
+                    log(f"[{label}] {msg}", type=type, data=data)
+            return _log
+
+        log("🚀 Initializing Database...")
+        init_db()
+        log(f"🚀 Crawling {len(self.source_urls)} sources with {self.browsers} browsers")
+
+        pending = queue.Queue()
+        for url in self.source_urls:
+            pending.put(url)
+
+        store = ThreadStore(DB_PATH)
+        crawlers = []
+
+        def worker(index):
+            from forum_crawler import AvidCrawler
+            try:
+                crawler = AvidCrawler(specific_urls=self.source_urls)
+            except Exception as e:
+                log(f"❌ Browser {index} failed to start: {e}")
+                return
+            with self.lock:
+                crawlers.append(crawler)
+            try:
+                while not (stop_event and stop_event.is_set()):
+                    try:
+                        start_url = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        count = crawler.crawl_source(start_url, store, stop_event=stop_event,
+                                                     log=source_log(start_url), limiter=self.limiter)
+                        log(f"✅ [{source_label(start_url)}] Source finished ({count} threads processed) on browser {index}")
+                    except Exception as e:
+                        log(f"❌ [{source_label(start_url)}] Source crashed: {e}")
+                    crawler.renew_driver()
+            finally:
+                crawler.release_driver()
+
+        threads = [threading.Thread(target=worker, args=(i + 1,), name=f"crawler-browser-{i + 1}", daemon=True)
+                   for i in range(self.browsers)]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            store.close()
+
+        if stop_event and stop_event.is_set():
+            log("🛑 Crawl stopped by user.")
+        for crawler in crawlers:
+            for line in crawler.wait_summary():
+                log(line)
+        for host, stats in self.limiter.snapshot().items():
+            if stats["throttled"]:
+                log(f"🐢 {host}: throttled {stats['throttled']} time(s), current rate {stats['rate']} req/s")
+        from driver_pool import driver_pool
+        log(f"♻️ Driver pool: {driver_pool.snapshot()}")
+        print("✅ Crawler workflow finished.")
+
+
+if __name__ == "__main__":
+    crawler = ParallelCrawler()
+    crawler.run()
@@ -0,0 +1,114 @@
+"""
+爬虫请求限速
+- 每个 host 一个令牌桶（CRAWLER_HOST_RPS / CRAWLER_HOST_BURST）
+- 全局令牌桶作为总请求速率上限（CRAWLER_MAX_RPS），所有 host 合计不超过该值
+- 自适应退避：429 / 5xx / 验证页时该 host 速率减半并冷却一段时间（优先使用 Retry-After），
+  之后每次成功按 10% 线性恢复到配置速率
+模块级的 rate_limiter 由进程内所有爬虫（HTTP / Selenium、并发的多个爬取任务）共享，
+CRAWLER_MAX_RPS 是整个进程的上限，一个任务触发的退避也会让其他任务一起放慢。
+JOB_EXECUTION_MODE=process 时每个任务进程各有一个限速器。
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+CRAWLER_MAX_RPS = float(os.getenv("CRAWLER_MAX_RPS", "2"))
+CRAWLER_HOST_RPS = float(os.getenv("CRAWLER_HOST_RPS", "1"))
+CRAWLER_HOST_BURST = float(os.getenv("CRAWLER_HOST_BURST", "2"))
+# 退避时 host 速率的下限，以及无 Retry-After 时的最长冷却时间（秒）
+CRAWLER_MIN_HOST_RPS = float(os.getenv("CRAWLER_MIN_HOST_RPS", "0.1"))
+CRAWLER_MAX_BACKOFF_SECONDS = float(os.getenv("CRAWLER_MAX_BACKOFF_SECONDS", "60"))
+
+
+class TokenBucket:
+    """预约式令牌桶：令牌可以为负，调用方按返回的等待时间排队，多线程下无需轮询"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(rate, 1e-6)
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        """取一个令牌，返回需要等待的秒数"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class HostState:
+    def __init__(self, rate: float, burst: float):
+        self.base_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.throttled = 0
+
+
+class HostRateLimiter:
+    def __init__(self, max_rps: float = CRAWLER_MAX_RPS, host_rps: float = CRAWLER_HOST_RPS,
+                 host_burst: float = CRAWLER_HOST_BURST):
+        self.host_rps = min(host_rps, max_rps) if max_rps > 0 else host_rps
+        self.host_burst = host_burst
+        self.global_bucket = TokenBucket(max_rps, 1.0) if max_rps > 0 else None
+        self.hosts: Dict[str, HostState] = {}
+        self.lock = threading.Lock()
+
+    def _host(self, host: str) -> HostState:
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.host_rps, self.host_burst)
+        return self.hosts[host]
+
+    def acquire(self, host: str, stop_event=None) -> bool:
+        """等待直到允许向 host 发出一个请求；等待期间收到停止信号返回 False"""
+        with self.lock:
+            now = time.monotonic()
+            state = self._host(host)
+            wait = max(state.bucket.reserve(now), state.cooldown_until - now)
+            if self.global_bucket is not None:
+                wait = max(wait, self.global_bucket.reserve(now))
+        if wait <= 0:
+            return not (stop_event and stop_event.is_set())
+        if stop_event is not None:
+            return not stop_event.wait(wait)
+        time.sleep(wait)
+        return True
+
+    def penalize(self, host: str, retry_after: Optional[float] = None) -> float:
+        """被限流 / 拦截：速率减半并进入冷却，返回冷却秒数"""
+        with self.lock:
+            state = self._host(host)
+            state.strikes += 1
+            state.throttled += 1
+            state.bucket.rate = max(CRAWLER_MIN_HOST_RPS, state.bucket.rate / 2)
+            delay = retry_after if retry_after is not None else min(CRAWLER_MAX_BACKOFF_SECONDS, 2 ** state.strikes)
+            state.cooldown_until = max(state.cooldown_until, time.monotonic() + delay)
+            return delay
+
+    def reward(self, host: str):
+        """请求成功：逐步恢复到配置速率"""
+        with self.lock:
+            state = self._host(host)
+            state.strikes = 0
+            if state.bucket.rate < state.base_rate:
+                state.bucket.rate = min(state.base_rate, state.bucket.rate + state.base_rate * 0.1)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                host: {"rate": round(state.bucket.rate, 3), "throttled": state.throttled}
+                for host, state in self.hosts.items()
+            }
+
+
+rate_limiter = HostRateLimiter()
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Retry-After 只处理秒数形式，HTTP 日期形式按未提供处理"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,168 @@
+"""
+爬虫的 SQLite 访问层
+- 读：每个线程一个只读连接（多个浏览器 / 抓取线程可以并发查询）
+- 写：所有写操作进入队列，由唯一的写线程按提交顺序执行，每次提交为一个事务
+- 按列表页批量：已知帖子一次 IN (...) 查询，source_url 回填与新帖写入合并为每页一个事务
+- 每页的事务同时更新该数据源的爬取游标（crawl_cursors），中断后可从上次的页码续爬
+数据库使用 WAL 模式（读写互不阻塞，synchronous=NORMAL 时提交不再每次 fsync），
+多个数据源并行爬取时不会出现 "database is locked"。
+"""
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DB_PATH = os.getenv("DATABASE_PATH", "backend/crawler/forums.db")
+# Fallback path logic
+if not os.path.exists(os.path.dirname(DB_PATH)):
+    DB_PATH = os.getenv("DATABASE_PATH", "forums.db")
+
+# SQLite 默认最多 999 个绑定参数，IN (...) 查询按此分批
+LOOKUP_CHUNK = 500
+
+
+def load_source_urls():
+    """sources 表中的全部数据源；读取失败或为空时返回默认论坛"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        c.execute("SELECT url FROM sources")
+        rows = c.fetchall()
+        conn.close()
+        if rows:
+            return [row[0] for row in rows]
+    except Exception:
+        pass
+    return ["https://community.avid.com/forums/398.aspx"]
+
+
+class ThreadStore:
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self.local = threading.local()
+        self.readers = []
+        self.readers_lock = threading.Lock()
+        self.queue: "queue.Queue" = queue.Queue()
+        self.writer = threading.Thread(target=self._writer_loop, name="crawler-sqlite-writer", daemon=True)
+        self.writer.start()
+
+    # ---------- 读 ----------
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self.local.conn = conn
+            with self.readers_lock:
+                self.readers.append(conn)
+        return conn
+
+    def get_threads(self, urls: Sequence[str]) -> Dict[str, str]:
+        """一次查询一页的帖子：返回已在库中的 {url: last_post_date}"""
+        known = {}
+        urls = list(dict.fromkeys(urls))
+        for i in range(0, len(urls), LOOKUP_CHUNK):
+            chunk = urls[i:i + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._reader().execute(
+                f"SELECT url, last_post_date FROM threads WHERE url IN ({placeholders})", chunk).fetchall()
+            known.update(rows)
+        return known
+
+    def count_source_threads(self, source_url: str) -> int:
+        return self._reader().execute("SELECT COUNT(*) FROM threads WHERE source_url = ?", (source_url,)).fetchone()[0]
+
+    def get_cursor(self, source_url: str) -> dict:
+        """{"last_page": int | None, "last_full_pass": str | None}"""
+        row = self._reader().execute(
+            "SELECT last_page, last_full_pass FROM crawl_cursors WHERE source_url = ?", (source_url,)).fetchone()
+        if not row:
+            return {"last_page": None, "last_full_pass": None}
+        return {"last_page": row[0], "last_full_pass": row[1]}
+
+    # ---------- 写 ----------
+
+    def submit(self, statements: List[Tuple[str, list]]) -> Future:
+        """提交一组 (sql, 参数行列表)，在写线程中逐条 executemany，整组为一个事务"""
+        future = Future()
+        self.queue.put((statements, future))
+        return future
+
+    def save_page(self, source_url: str, urls: Sequence[str],
+                  threads: Sequence[Tuple[str, str, str, str]], cursor_page: Optional[int] = None) -> Future:
+        """
+        一个列表页的全部写入（一个事务）:
+        - urls: 页面上的所有帖子，回填 source_url（无论是否有更新）
+        - threads: 新抓取 / 有更新的帖子 (url, title, question_content, last_post_date)
+        - cursor_page: 记录到游标的已处理页码
+        """
+        now = datetime.now().isoformat()
+        statements = []
+        if cursor_page is not None:
+            statements.append(("""INSERT INTO crawl_cursors (source_url, last_page, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(source_url) DO UPDATE SET last_page = excluded.last_page, updated_at = excluded.updated_at""",
+                [(source_url, cursor_page, now)]))
+        if urls:
+            statements.append(("UPDATE threads SET source_url = ? WHERE url = ?",
+                               [(source_url, url) for url in urls]))
+        if threads:
+            # Use INSERT OR REPLACE to update last_post_date and source_url for existing threads
+            statements.append(("""INSERT OR REPLACE INTO threads
+                (id, title, url, question_content, last_post_date, scraped_at, source_url)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [(url, title, url, question_content, last_post_date, now, source_url)
+                 for url, title, question_content, last_post_date in threads]))
+        return self.submit(statements)
+
+    def mark_source_updated(self, source_url: str) -> Future:
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
+        return self.submit([("UPDATE sources SET last_updated = ? WHERE url = ?", [(now_str, source_url)])])
+
+    def finish_cursor(self, source_url: str, full_pass: bool) -> Future:
+        """本次爬取正常结束：清除续爬页码；full_pass 时记录完整爬完的时间"""
+        now = datetime.now().isoformat()
+        return self.submit([("""INSERT INTO crawl_cursors (source_url, last_page, last_full_pass, updated_at)
+            VALUES (?, NULL, ?, ?)
+            ON CONFLICT(source_url) DO UPDATE SET last_page = NULL,
+                last_full_pass = COALESCE(excluded.last_full_pass, last_full_pass),
+                updated_at = excluded.updated_at""",
+            [(source_url, now if full_pass else None, now)])])
+
+    def flush(self):
+        """等待此前提交的写操作全部完成（之后的读可以看到这些写入）"""
+        self.submit([]).result()
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+        with self.readers_lock:
+            for conn in self.readers:
+                conn.close()
+            self.readers = []
+
+    def _writer_loop(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")  # 持久设置，对之后打开的所有连接生效
+        except sqlite3.OperationalError:
+            pass  # 其他连接正在使用时无法切换，保持原模式
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                statements, future = item
+                try:
+                    with conn:
+                        for sql, rows in statements:
+                            conn.executemany(sql, rows)
+                    future.set_result(True)
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            conn.close()
@@ -0,0 +1,218 @@
+"""
+后台任务（爬虫 / PDF 索引）持久化表结构
+"""
+import json
+import sqlite3
+import os
+from datetime import datetime
+
+DB_PATH = os.getenv("DATABASE_PATH", "backend/crawler/forums.db")
+
+# 任务类型命名空间：同一个数字 ID 在不同类型下互不冲突
+JOB_TYPES = ("crawl", "index")
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def init_job_tables():
+    """初始化任务表，并把上次进程退出时仍在运行的任务标记为 interrupted"""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+
+    c.execute('''CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_type TEXT NOT NULL,
+        target_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        created_at TEXT,
+        started_at TEXT,
+        finished_at TEXT,
+        progress_current INTEGER DEFAULT 0,
+        progress_total INTEGER DEFAULT 0,
+        last_message TEXT,
+        metrics TEXT,
+        error_message TEXT
+    )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_type_target ON jobs (job_type, target_id, id)")
+
+    # 长任务中被挤出内存回放缓冲的事件（SSE Last-Event-ID 续传用）
+    c.execute('''CREATE TABLE IF NOT EXISTS job_events (
+        job_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        PRIMARY KEY (job_id, seq)
+    )''')
+    # 事件只用于运行中任务的续传，重启后不再需要（正常结束的任务在清理时已删除）
+    c.execute("DELETE FROM job_events")
+
+    placeholders = ",".join("?" for _ in ACTIVE_STATUSES)
+    # 被中断的索引任务：PDF 标记为 cancelled（保留断点，再次索引时续传），不再一直显示 processing
+    try:
+        c.execute(f'''UPDATE pdf_documents SET indexing_status = 'cancelled'
+                     WHERE indexing_status = 'processing' AND id IN (
+                         SELECT target_id FROM jobs WHERE job_type = 'index' AND status IN ({placeholders}))''',
+                  ACTIVE_STATUSES)
+    except sqlite3.OperationalError:
+        pass  # pdf_documents 表尚未创建
+    c.execute(f'''UPDATE jobs SET status = 'interrupted', finished_at = ?
+                 WHERE status IN ({placeholders})''', (_now(), *ACTIVE_STATUSES))
+
+    conn.commit()
+    conn.close()
+    print("Job database tables initialized.")
+
+
+def create_job(job_type, target_id, status='running'):
+    """创建任务记录，返回任务 ID"""
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    now = _now()
+    c.execute('''INSERT INTO jobs (job_type, target_id, status, created_at, started_at)
+                 VALUES (?, ?, ?, ?, ?)''',
+              (job_type, target_id, status, now, now if status == 'running' else None))
+    conn.commit()
+    job_id = c.lastrowid
+    conn.close()
+    return job_id
+
+
+def update_job(job_id, status=None, progress_current=None, progress_total=None,
+               last_message=None, metrics=None, error_msg=None):
+    """更新任务状态 / 进度；进入终态时写入 finished_at"""
+    updates = []
+    values = []
+
+    if status is not None:
+        updates.append("status = ?")
+        values.append(status)
+        if status == 'running':
+            updates.append("started_at = COALESCE(started_at, ?)")
+            values.append(_now())
+        elif status not in ACTIVE_STATUSES:
+            updates.append("finished_at = ?")
+            values.append(_now())
+
+    if progress_current is not None:
+        updates.append("progress_current = ?")
+        values.append(progress_current)
+
+    if progress_total is not None:
+        updates.append("progress_total = ?")
+        values.append(progress_total)
+
+    if last_message is not None:
+        updates.append("last_message = ?")
+        values.append(last_message[:500])
+
+    if metrics is not None:
+        updates.append("metrics = ?")
+        values.append(json.dumps(metrics, ensure_ascii=False))
+
+    if error_msg:
+        updates.append("error_message = ?")
+        values.append(error_msg)
+
+    if not updates:
+        return
+
+    values.append(job_id)
+
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute(f'''UPDATE jobs SET {', '.join(updates)} WHERE id = ?''', values)
+    conn.commit()
+    conn.close()
+
+
+def _row_to_job(row):
+    job = dict(row)
+    job["metrics"] = json.loads(job["metrics"]) if job.get("metrics") else None
+    return job
+
+
+def get_job(job_id):
+    """根据 ID 获取任务"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+
+    c.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+    row = c.fetchone()
+    conn.close()
+
+    return _row_to_job(row) if row else None
+
+
+def list_jobs(job_type=None, target_id=None, status=None, limit=50, offset=0):
+    """按条件查询任务历史（最新的在前）"""
+    conditions = []
+    values = []
+
+    if job_type:
+        conditions.append("job_type = ?")
+        values.append(job_type)
+    if target_id is not None:
+        conditions.append("target_id = ?")
+        values.append(target_id)
+    if status:
+        conditions.append("status = ?")
+        values.append(status)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    values.extend([limit, offset])
+
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+
+    c.execute(f'''SELECT * FROM jobs {where} ORDER BY id DESC LIMIT ? OFFSET ?''', values)
+    rows = c.fetchall()
+    conn.close()
+
+    return [_row_to_job(row) for row in rows]
+
+
+def add_job_events(job_id, events):
+    """批量写入任务事件，events 为 [(seq, payload_dict), ...]"""
+    if not events:
+        return
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.executemany('''INSERT OR IGNORE INTO job_events (job_id, seq, payload) VALUES (?, ?, ?)''',
+                  [(job_id, seq, json.dumps(payload, ensure_ascii=False, default=str)) for seq, payload in events])
+    conn.commit()
+    conn.close()
+
+
+def list_job_events(job_id, after_seq=0, before_seq=None):
+    """按序号返回 after_seq < seq < before_seq 的事件 [(seq, payload_dict), ...]"""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if before_seq is None:
+        c.execute('''SELECT seq, payload FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq''',
+                  (job_id, after_seq))
+    else:
+        c.execute('''SELECT seq, payload FROM job_events WHERE job_id = ? AND seq > ? AND seq < ? ORDER BY seq''',
+                  (job_id, after_seq, before_seq))
+    rows = c.fetchall()
+    conn.close()
+    return [(seq, json.loads(payload)) for seq, payload in rows]
+
+
+def delete_job_events(job_id):
+    """任务清理后删除其事件（续传只在任务仍在内存中时可用）"""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute('DELETE FROM job_events WHERE job_id = ?', (job_id,))
+    conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    init_job_tables()
@@ -25,9 +25,16 @@ def init_pdf_tables():
         last_indexed TEXT,
         indexing_status TEXT DEFAULT 'pending',
         error_message TEXT,
-        doc_type TEXT DEFAULT 'manual'
+        doc_type TEXT DEFAULT 'manual',
+        last_indexed_page INTEGER DEFAULT 0
     )''')
 
+    # 旧库迁移：索引断点（已完整向量化的最后一页）
+    c.execute("PRAGMA table_info(pdf_documents)")
+    columns = {row[1] for row in c.fetchall()}
+    if "last_indexed_page" not in columns:
+        c.execute("ALTER TABLE pdf_documents ADD COLUMN last_indexed_page INTEGER DEFAULT 0")
+
     conn.commit()
     conn.close()
     print("PDF database tables initialized.")
@@ -85,6 +92,16 @@ def update_pdf_status(pdf_id, status, total_pages=None, total_chunks=None, error
     conn.close()
 
 
+def update_pdf_checkpoint(pdf_id, last_page, total_chunks):
+    """记录索引断点：last_page 及之前的页面已全部写入向量库"""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute('''UPDATE pdf_documents SET last_indexed_page = ?, total_chunks = ? WHERE id = ?''',
+              (last_page, total_chunks, pdf_id))
+    conn.commit()
+    conn.close()
+
+
 def get_all_pdfs():
     """获取所有 PDF 记录"""
     conn = sqlite3.connect(DB_PATH)
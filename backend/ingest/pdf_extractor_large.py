@@ -53,17 +53,49 @@ class LargePDFExtractor:
         if not os.path.exists(self.worker_script):
             raise FileNotFoundError(f"Worker script not found: {self.worker_script}")
 
+    def _run_page_worker(self, cmd: List[str], env: dict, timeout: float, stop_event=None) -> str:
+        """
+        运行单页提取子进程，返回 "ok" / "timeout" / "cancelled"。
+        使用 Popen 轮询等待，超时或收到取消信号时立即 kill。
+        """
+        proc = subprocess.Popen(
+            cmd,
+            env=env,
+            stdout=subprocess.DEVNULL,  # 忽略输出
+            stderr=subprocess.DEVNULL
+        )
+        deadline = time.time() + timeout
+        try:
+            while True:
+                try:
+                    proc.wait(timeout=0.1)
+                    return "ok"
+                except subprocess.TimeoutExpired:
+                    pass
+                if stop_event is not None and stop_event.is_set():
+                    return "cancelled"
+                if time.time() >= deadline:
+                    return "timeout"
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
     def extract_text_stream(
         self,
         batch_size: int = 100,
-        progress_callback: Optional[Callable[[int, int, str], None]] = None
+        progress_callback: Optional[Callable[[int, int, str], None]] = None,
+        stop_event=None,
+        start_page: int = 1
     ) -> Iterator[List[Dict]]:
         """
         流式提取 PDF 文本（Subprocess Sandbox 超时保护）
 
         Args:
-            batch_size: 每批返回的 chunk 数量
+            batch_size: 每批返回的 chunk 数量（批次总是在页边界切分）
             progress_callback: 进度回调函数 callback(current_page, total_pages, message)
+            stop_event: 取消信号（threading.Event），设置后杀掉当前页面子进程并停止产出
+            start_page: 从第几页开始（1 起），用于断点续传
 
         Yields:
             每批文本块列表
@@ -83,8 +115,12 @@ class LargePDFExtractor:
             python_exe = sys.executable
             
             # PyMuPDF is 0-indexed, human readable is 1-indexed
-            for page_idx in range(total_pages):
+            for page_idx in range(max(0, start_page - 1), total_pages):
                 page_num = page_idx + 1
+
+                if stop_event is not None and stop_event.is_set():
+                    logger.info(f"Extraction cancelled before page {page_num}")
+                    return
                 
                 # 1. 创建私有临时目录 (Sandbox)
                 # 所有的临时文件都会被限制在这里
@@ -103,7 +139,7 @@ class LargePDFExtractor:
                     env["TMP"] = sandbox_dir
                     
                     # 4. 运行子进程
-                    # 使用 subprocess.run 比 multiprocessing 更干净，因为它完全隔离了内存和文件描述符
+                    # 独立子进程比 multiprocessing 更干净，因为它完全隔离了内存和文件描述符
                     cmd = [
                         python_exe, 
                         self.worker_script,
@@ -112,19 +148,13 @@ class LargePDFExtractor:
                         "--output", output_path
                     ]
                     
-                    try:
-                        # 运行并在 10 秒后超时
-                        subprocess.run(
-                            cmd, 
-                            env=env, 
-                            timeout=10, 
-                            check=False,
-                            stdout=subprocess.DEVNULL,  # 忽略输出
-                            stderr=subprocess.DEVNULL
-                        )
-                    except subprocess.TimeoutExpired:
-                        # 超时! subprocess 会自动杀掉子进程 (虽然不一定 kill -9, 但通常足够)
-                        # 如果需要更强力的 kill，可能需要 Popen
+                    # 运行并在 10 秒后超时（超时 / 取消都会 kill 子进程）
+                    outcome = self._run_page_worker(cmd, env, timeout=10, stop_event=stop_event)
+                    if outcome == "cancelled":
+                        # 未完成的页面不产出；已累积但未 yield 的整页块同样丢弃，续传时从检查点重新提取
+                        logger.info(f"Extraction cancelled on page {page_num}")
+                        return
+                    if outcome == "timeout":
                         logger.error(f"Page {page_num} timed out (Subprocess > 10s)")
                         if progress_callback:
                             progress_callback(page_num, total_pages, f"⚠️ Skipped page {page_num} (Timeout)")
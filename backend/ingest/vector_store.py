@@ -2,6 +2,7 @@ import sqlite3
 import chromadb
 from chromadb.utils import embedding_functions
 import os
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -30,13 +31,38 @@ def setup_chroma():
     )
     return collection
 
+# 论坛列表页上的最后回复时间格式，例如 "Jan 12 2024 4:00 PM"
+FORUM_DATE_FORMATS = ["%b %d %Y %I:%M %p", "%B %d %Y %I:%M %p"]
+
+
+def to_timestamp(value):
+    """
+    将 ISO 时间或论坛日期字符串转换为 Unix 时间戳（int），无法解析时返回 None。
+    Chroma 的 $gte/$lte 只支持数值，因此日期过滤依赖这些 *_ts 字段。
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        pass
+    for fmt in FORUM_DATE_FORMATS:
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    return None
+
+
 def fetch_threads_from_sqlite():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     # Fetch original question content from threads
     c.execute('''
-        SELECT id, question_content as content, 'System' as author, scraped_at as post_date, title, url 
+        SELECT id, question_content as content, 'System' as author, scraped_at as post_date, title, url,
+               scraped_at, last_post_date, source_url
         FROM threads
     ''')
     threads = c.fetchall()
@@ -68,13 +94,24 @@ def ingest_vectors():
         ids.append(f"thread_{short_id}")
 
         documents.append(full_text)
-        metadatas.append({
+        metadata = {
             "source": "forum",
             "url": thread['url'],
             "author": thread['author'],
             "date": thread['post_date'],
             "title": thread['title']
-        })
+        }
+
+        # 过滤用元数据：版块 URL 与数值时间戳（Chroma 不接受 None 值，缺失时不写入）
+        if thread['source_url']:
+            metadata["source_url"] = thread['source_url']
+        scraped_ts = to_timestamp(thread['scraped_at'])
+        if scraped_ts is not None:
+            metadata["scraped_at_ts"] = scraped_ts
+        last_post_ts = to_timestamp(thread['last_post_date'])
+        if last_post_ts is not None:
+            metadata["last_post_date_ts"] = last_post_ts
+        metadatas.append(metadata)
 
         # Batch ingest every 100 items
         if len(ids) >= 100:
@@ -92,13 +129,15 @@ def ingest_vectors():
     print(f"Forum ingestion complete. Total items in collection: {collection.count()}")
 
 
-def ingest_pdf_chunks(pdf_id: int, log_callback=None):
+def ingest_pdf_chunks(pdf_id: int, log_callback=None, stop_event=None):
     """
     向量化单个 PDF 文档（流式处理优化版 - 适用于大文档）
 
     Args:
         pdf_id: PDF 在数据库中的 ID
         log_callback: 日志回调函数
+        stop_event: 取消信号；正在写入的批次会完成，之后的批次不再写入，
+                    PDF 标记为 cancelled 并保留断点，再次索引时从断点继续
     """
     def log(msg):
         if log_callback:
@@ -108,7 +147,7 @@ def ingest_pdf_chunks(pdf_id: int, log_callback=None):
 
     try:
         from pdf_extractor_large import LargePDFExtractor
-        from pdf_schema import get_pdf_by_id, update_pdf_status
+        from pdf_schema import get_pdf_by_id, update_pdf_status, update_pdf_checkpoint
 
         # 获取 PDF 信息
         pdf_record = get_pdf_by_id(pdf_id)
@@ -139,6 +178,16 @@ def ingest_pdf_chunks(pdf_id: int, log_callback=None):
         start_time = None  # 用于计算速度
         vectorizing_start_page = 0  # 记录向量化起始页
 
+        # 上次未完成（取消 / 进程重启 / worker 被强制结束）：从断点之后继续
+        # （chunk ID 由文件名 + 页码确定，重复写入也是幂等的）；已完成的 PDF 重新索引时从头开始
+        start_page = 1
+        if pdf_record.get('indexing_status') != 'completed' and (pdf_record.get('last_indexed_page') or 0) > 0:
+            start_page = pdf_record['last_indexed_page'] + 1
+            total_chunks = pdf_record.get('total_chunks') or 0
+            log(f"  ⏩ Resuming from page {start_page} ({total_chunks} chunks already indexed)")
+        else:
+            update_pdf_checkpoint(pdf_id, 0, 0)
+
         import gc
 
 
@@ -156,21 +205,22 @@ def ingest_pdf_chunks(pdf_id: int, log_callback=None):
             speed = current_page / elapsed if elapsed > 0 else 0
             eta = (total_pg - current_page) / speed if speed > 0 else 0
 
-            # 发送文本日志（兼容性）
-            log(f"  ⏳ {message} (速度: {speed:.1f}页/秒, 剩余: {eta:.0f}秒)")
-
-            # 发送结构化进度数据（新增）
-            if log_callback:
-                progress_data = {
-                    "type": "progress",
-                    "current": current_page,
-                    "total": total_pg,
-                    "chunks": total_chunks,
-                    "speed": round(speed, 2),  # 保留2位小数更准确
-                    "percentage": round((current_page / total_pg * 100), 1) if total_pg > 0 else 0,
-                    "eta": round(eta)  # 预计剩余时间（秒）
-                }
-                log_callback(progress_data, type="progress")
+            text = f"  ⏳ {message} (速度: {speed:.1f}页/秒, 剩余: {eta:.0f}秒)"
+            if not log_callback:
+                print(text)
+                return
+
+            # 文本与结构化进度放在同一个 progress 事件中：每页一条，由 TaskManager 按
+            # PROGRESS_EVENT_INTERVAL_MS 合并，不再额外发送逐页的 log 事件
+            progress_data = {
+                "current": current_page,
+                "total": total_pg,
+                "chunks": total_chunks,
+                "speed": round(speed, 2),  # 保留2位小数更准确
+                "percentage": round((current_page / total_pg * 100), 1) if total_pg > 0 else 0,
+                "eta": round(eta)  # 预计剩余时间（秒）
+            }
+            log_callback(text, type="progress", data=progress_data)
 
         # 更新状态为处理中
         update_pdf_status(pdf_id, 'processing', total_pages=total_pages)
@@ -183,10 +233,19 @@ def ingest_pdf_chunks(pdf_id: int, log_callback=None):
             retry_count = 0
             max_retries = 2  # 最多重试2次
 
-            for batch in extractor.extract_text_stream(
+            cancelled = False
+            stream = extractor.extract_text_stream(
                 batch_size=batch_size,
-                progress_callback=progress_callback
-            ):
+                progress_callback=progress_callback,
+                stop_event=stop_event,
+                start_page=start_page
+            )
+            for batch in stream:
+                if stop_event is not None and stop_event.is_set():
+                    # 尚未写入的批次直接丢弃，关闭生成器会杀掉正在运行的页面子进程
+                    cancelled = True
+                    break
+
                 if not batch:
                     continue
 
@@ -197,7 +256,7 @@ def ingest_pdf_chunks(pdf_id: int, log_callback=None):
                 # 准备这批数据
                 ids = [chunk['id'] for chunk in batch]
                 documents = [chunk['content'] for chunk in batch]
-                metadatas = [chunk['metadata'] for chunk in batch]
+                metadatas = [dict(chunk['metadata'], pdf_id=pdf_id) for chunk in batch]
 
                 try:
                     import time
@@ -216,6 +275,10 @@ def ingest_pdf_chunks(pdf_id: int, log_callback=None):
                     # 更新计数
                     total_chunks += len(batch)
 
+                    # 批次在页边界切分：写入成功后推进断点（之前有失败批次时不推进，避免续传跳过失败页）
+                    if not failed_batches:
+                        update_pdf_checkpoint(pdf_id, last_page, total_chunks)
+
                     # 向量化完成提示
                     log(f"  ✅ Vectorized {len(batch)} chunks (pages {first_page}-{last_page})")
 
@@ -229,6 +292,12 @@ def ingest_pdf_chunks(pdf_id: int, log_callback=None):
 
                 # 发送进度更新（使用最后处理的页码）
                 progress_callback(last_page, total_pages, f"Processed {last_page}/{total_pages} pages")
+            stream.close()
+
+            if cancelled or (stop_event is not None and stop_event.is_set()):
+                update_pdf_status(pdf_id, 'cancelled', total_chunks=total_chunks)
+                log(f"🛑 Indexing stopped; {total_chunks} chunks kept, resume will continue after the last completed batch")
+                return False
 
             # 打印处理总结
             if failed_batches:
@@ -13,7 +13,7 @@ interface PDFDocument {
     total_chunks: number;
     upload_date: string;
     last_indexed: string;
-    status: 'pending' | 'processing' | 'completed' | 'failed' | 'partial';
+    status: 'pending' | 'processing' | 'completed' | 'failed' | 'partial' | 'cancelled';
     error: string | null;
 }
 
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+测试 HTTP 爬虫引擎（离线）
+用本地 HTTP 服务器提供 backend/crawler/fixtures 中保存的论坛页面：
+- 列表页分页、帖子正文解析、写入 SQLite
+- 并发抓取遵守总请求速率上限（同进程的爬取任务共享），429 时退避后重试
+- 第二次运行时无更新的帖子不再抓取
+- 验证页触发浏览器回退
+- 达到深度上限后记录游标，下次跳过已爬过的页直接续爬
+- 页内中途停止时游标不前进
+- 没有帖子也没有分页区的页面（验证页 / 结构变化）不清除游标
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend", "crawler", "fixtures")
+
+# 在导入爬虫模块之前指定临时数据库
+TMP_DIR = tempfile.mkdtemp(prefix="crawler_test_")
+os.environ["DATABASE_PATH"] = os.path.join(TMP_DIR, "forums.db")
+sys.path.insert(0, os.path.join(os.getcwd(), "backend", "crawler"))
+
+
+# 首次请求返回 429 的路径（验证退避重试）
+THROTTLE_ONCE = {"/forums/t/103.aspx"}
+
+
+def make_fixture_handler(hits: Counter, request_times: list):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            hits[parsed.path] += 1
+            request_times.append(time.monotonic())
+
+            # /deep/... 模拟一个很深的版块：40 条 / 4 页，第 3、4 页沿用第 2 页的内容
+            deep = parsed.path.startswith("/deep/")
+            path = parsed.path[len("/deep"):] if deep else parsed.path
+            page = parse_qs(parsed.query).get("PageIndex", ["1"])[0]
+            if deep:
+                hits[f"deep:{page}"] += 1
+                page = min(page, "2")
+
+            if parsed.path in THROTTLE_ONCE and hits[parsed.path] == 1:
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            if path == "/forums/398.aspx":
+                name = f"listing_page{page}.html"
+            elif path.startswith("/forums/t/"):
+                name = f"thread_{path.rsplit('/', 1)[-1].split('.')[0]}.html"
+            elif path == "/forums/challenge.aspx":
+                name = "challenge.html"
+            else:
+                name = None
+
+            path = os.path.join(FIXTURES, name) if name else None
+            if not path or not os.path.exists(path):
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            with open(path, "rb") as f:
+                body = f.read()
+            if deep:
+                body = body.replace(b"(4 items)", b"(40 items)").replace(b" of 2 ", b" of 4 ")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return FixtureHandler
+
+
+def start_fixture_server():
+    hits = Counter()
+    request_times = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_fixture_handler(hits, request_times))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", hits, request_times
+
+
+def main():
+    print("=" * 60)
+    print("HTTP 爬虫引擎测试（本地 fixtures）")
+    print("=" * 60)
+
+    import sqlite3
+    from db_schema import init_db
+    from http_crawler import HttpCrawler
+    from rate_limit import HostRateLimiter
+
+    server, base, hits, request_times = start_fixture_server()
+    source_url = f"{base}/forums/398.aspx"
+    init_db()
+    passed = True
+
+    # 1. 首次爬取：两页列表 + 4 个帖子（4 个并发 worker，总速率上限 4 req/s）
+    max_rps = 4.0
+    crawler = HttpCrawler(specific_urls=[source_url], workers=4,
+                          limiter=HostRateLimiter(max_rps=max_rps, host_rps=max_rps, host_burst=1))
+    crawler.run()
+    conn = sqlite3.connect(os.environ["DATABASE_PATH"])
+    rows = conn.execute("SELECT url, title, question_content, last_post_date, source_url FROM threads ORDER BY url").fetchall()
+    if len(rows) == 4 and all(r[2].startswith("Question body for thread") and r[4] == source_url for r in rows):
+        print(f"✅ 首次爬取写入 {len(rows)} 个帖子")
+    else:
+        print(f"❌ 首次爬取结果错误: {rows}")
+        passed = False
+    if rows and rows[0][3] == "Jan 12 2024 4:00 PM":
+        print("✅ 最后回复时间解析正确")
+    else:
+        print(f"❌ 最后回复时间解析错误: {rows[:1]}")
+        passed = False
+
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if journal_mode == "wal":
+        print("✅ 数据库已切换为 WAL 模式")
+    else:
+        print(f"❌ 数据库日志模式错误: {journal_mode}")
+        passed = False
+
+    # 任意 1 秒窗口内的请求数不超过上限（加 1 容许窗口边界）
+    busiest = max(sum(1 for t in request_times if start <= t < start + 1.0) for start in request_times)
+    if busiest <= max_rps + 1:
+        print(f"✅ 请求速率未超过上限（最繁忙的 1 秒内 {busiest} 个请求）")
+    else:
+        print(f"❌ 请求速率超过上限: 1 秒内 {busiest} 个请求")
+        passed = False
+
+    throttled = sum(stats["throttled"] for stats in crawler.limiter.snapshot().values())
+    if throttled == 1 and hits["/forums/t/103.aspx"] == 2:
+        print("✅ 429 后退避并重试成功")
+    else:
+        print(f"❌ 429 处理错误: throttled={throttled}, hits={hits['/forums/t/103.aspx']}")
+        passed = False
+
+    # 2. 再次爬取：第一页全部无更新，不再请求帖子页
+    thread_hits_before = sum(n for path, n in hits.items() if path.startswith("/forums/t/"))
+    HttpCrawler(specific_urls=[source_url]).run()
+    thread_hits_after = sum(n for path, n in hits.items() if path.startswith("/forums/t/"))
+    if thread_hits_after == thread_hits_before:
+        print("✅ 增量爬取跳过无更新的帖子")
+    else:
+        print(f"❌ 增量爬取重复抓取了 {thread_hits_after - thread_hits_before} 个帖子")
+        passed = False
+
+    # 同一进程中的多个爬取任务共用一个限速器（CRAWLER_MAX_RPS 是进程级上限）
+    if HttpCrawler(specific_urls=[source_url]).limiter is HttpCrawler(specific_urls=[source_url]).limiter:
+        print("✅ 多个爬取任务共享同一个限速器")
+    else:
+        print("❌ 每个爬取任务各自创建了限速器")
+        passed = False
+
+    # 3. 验证页：交给浏览器（此处用替身返回通过验证后的页面）
+    class BrowserStubCrawler(HttpCrawler):
+        def _fetch_with_browser(self, url, log):
+            self.browser_fallbacks += 1
+            with open(os.path.join(FIXTURES, "listing_page2.html"), encoding="utf-8") as f:
+                return f.read()
+
+    crawler = BrowserStubCrawler(specific_urls=[f"{base}/forums/challenge.aspx"])
+    crawler.run()
+    if crawler.browser_fallbacks == 1:
+        print("✅ 验证页触发浏览器回退")
+    else:
+        print(f"❌ 浏览器回退次数错误: {crawler.browser_fallbacks}")
+        passed = False
+
+    # 4. 深度上限 + 续爬游标（localhost 与 127.0.0.1 的帖子地址不同，视为新帖）
+    deep_url = f"http://localhost:{server.server_address[1]}/deep/forums/398.aspx"
+
+    def cursor():
+        return conn.execute("SELECT last_page, last_full_pass FROM crawl_cursors WHERE source_url = ?",
+                            (deep_url,)).fetchone()
+
+    HttpCrawler(specific_urls=[deep_url], max_pages=1).run()
+    if cursor() == (1, None) and hits["deep:2"] == 0:
+        print("✅ 达到深度上限后记录游标（已处理到第 1 页）")
+    else:
+        print(f"❌ 深度上限 / 游标错误: cursor={cursor()}, page2 hits={hits['deep:2']}")
+        passed = False
+
+    HttpCrawler(specific_urls=[deep_url], max_pages=2).run()
+    HttpCrawler(specific_urls=[deep_url], max_pages=2).run()
+    if hits["deep:2"] == 1 and hits["deep:3"] == 1 and cursor()[0] == 3:
+        print("✅ 回填从上次中断的页码续爬（未重复请求第 2 页）")
+    else:
+        print(f"❌ 续爬错误: cursor={cursor()}, hits={dict(hits)}")
+        passed = False
+
+    HttpCrawler(specific_urls=[deep_url]).run()
+    if hits["deep:3"] == 1 and hits["deep:4"] == 1 and cursor()[0] is None and cursor()[1]:
+        print("✅ 到达末页后清除游标并记录完整爬取时间")
+    else:
+        print(f"❌ 完整爬取后游标错误: cursor={cursor()}, hits={dict(hits)}")
+        passed = False
+
+    # 5. 第 2 页抓完第一个帖子后停止：已抓到的帖子照常写入，游标仍停在第 1 页
+    conn.execute("DELETE FROM threads WHERE url LIKE 'http://localhost:%'")
+    conn.execute("DELETE FROM crawl_cursors WHERE source_url = ?", (deep_url,))
+    conn.commit()
+    stop_event = threading.Event()
+    on_page = {"page": 0}
+
+    def stop_on_page2(msg, type="log", data=None):
+        if msg.startswith("📄 Processing Page"):
+            on_page["page"] = int(msg.split()[3])
+        if on_page["page"] == 2 and "✅ Topic" in msg:
+            stop_event.set()
+
+    HttpCrawler(specific_urls=[deep_url], workers=1).run(stop_event=stop_event, log_callback=stop_on_page2)
+    saved = conn.execute("SELECT COUNT(*) FROM threads WHERE url LIKE 'http://localhost:%'").fetchone()[0]
+    if cursor() == (1, None) and saved == 3:
+        print("✅ 页内中途停止时游标不前进（已抓到的帖子已写入）")
+    else:
+        print(f"❌ 中途停止后游标错误: cursor={cursor()}, saved={saved}")
+        passed = False
+
+    # 6. 第 1 页既没有帖子也没有分页区：按加载失败处理，保留回填游标
+    from page_walker import walk_source
+    from thread_store import ThreadStore
+    empty_url = f"{base}/empty/forums/1.aspx"
+    store = ThreadStore(os.environ["DATABASE_PATH"])
+    store.save_page(empty_url, [], [], cursor_page=15).result()
+
+    def empty_listing(paging):
+        def fetch_listing(listing_url, page, log, stop_event=None):
+            return {"threads": [], "total_items": 0, "total_pages": 1 if paging else 0,
+                    "page_links": {}, "area_count": 0}
+        return fetch_listing
+
+    def no_threads(threads, log, stop_event=None):
+        return iter(())
+
+    walk_source(empty_url, store, empty_listing(False), no_threads, log=lambda *a, **k: None)
+    kept = store.get_cursor(empty_url)["last_page"]
+    walk_source(empty_url, store, empty_listing(True), no_threads, log=lambda *a, **k: None)
+    store.flush()
+    cleared = store.get_cursor(empty_url)["last_page"]
+    store.close()
+    if kept == 15 and cleared is None:
+        print("✅ 无分页信息的空页保留游标，分页区显示已到末页时才清除")
+    else:
+        print(f"❌ 空页游标处理错误: kept={kept}, cleared={cleared}")
+        passed = False
+
+    conn.close()
+    server.shutdown()
+
+    print("=" * 60)
+    print("✓ 测试完成" if passed else "✗ 存在失败项")
+    print("=" * 60)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+测试 LLM 路由层（对冲请求 / 故障切换 / 熔断）
+使用本地 OpenAI 兼容的 stub 服务器，无需真实的 Ollama 或 DeepSeek：
+- slow stub: 首 token 前延迟若干秒（模拟卡住的本地 Ollama）
+- fast stub: 立即开始输出（模拟 DeepSeek）
+- broken stub: 返回 500
+另外验证：排队已满（ProviderBusyError）与对冲落败不计入熔断；半开状态只放行一个试探请求
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_stub_handler(first_token_delay=0.0, fail=False, text="stub answer"):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+
+            if fail:
+                self.send_response(500)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(b'{"error": {"message": "stub failure"}}')
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+
+            time.sleep(first_token_delay)
+            try:
+                for word in text.split(" "):
+                    chunk = {
+                        "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+                        "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return StubHandler
+
+
+def start_stub(**kwargs):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_stub_handler(**kwargs))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+async def collect(router, provider):
+    start = time.time()
+    parts = []
+    async for token in router.stream(provider, [{"role": "user", "content": "hi"}]):
+        parts.append(token)
+    return "".join(parts).strip(), time.time() - start
+
+
+def main():
+    print("=" * 60)
+    print("LLM 路由层测试（本地 stub 服务器）")
+    print("=" * 60)
+
+    slow_server, slow_url = start_stub(first_token_delay=3.0, text="slow local answer")
+    fast_server, fast_url = start_stub(text="fast fallback answer")
+    broken_server, broken_url = start_stub(fail=True)
+
+    # llm_clients / llm_router 在导入时读取环境变量
+    os.environ["OPENAI_BASE_URL"] = slow_url
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["DEEPSEEK_BASE_URL"] = fast_url
+    os.environ["DEEPSEEK_API_KEY"] = "stub"
+    os.environ["LLM_FALLBACK_PROVIDER"] = "deepseek"
+    os.environ["LLM_HEDGE_AFTER_SECONDS"] = "0.5"
+    os.environ["LLM_BREAKER_FAILURES"] = "2"
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "backend", "api"))
+
+    from llm_router import LLMRouter, CircuitBreaker
+    from llm_clients import llm_pool
+    from llm_limiter import llm_limiters, ProviderLimiter, ProviderBusyError
+
+    passed = True
+
+    async def run():
+        nonlocal passed
+
+        # 1. 对冲：本地 3 秒无首 token，0.5 秒后对冲到 DeepSeek
+        router = LLMRouter(fallback_provider="deepseek", hedge_after=0.5)
+        text, elapsed = await collect(router, "local")
+        if text == "fast fallback answer" and elapsed < 2.5:
+            print(f"✅ 对冲请求生效，{elapsed:.2f}s 内由备用 provider 返回")
+        else:
+            print(f"❌ 对冲请求失败: '{text}' ({elapsed:.2f}s)")
+            passed = False
+        if router.breaker("local").failures == 0:
+            print("✅ 对冲落败的一路不计为失败")
+        else:
+            print(f"❌ 对冲落败被计为失败: {router.breaker('local').failures}")
+            passed = False
+
+        # 2. 无备用时等待主 provider
+        router = LLMRouter(fallback_provider="", hedge_after=0.5)
+        text, elapsed = await collect(router, "local")
+        if text == "slow local answer":
+            print(f"✅ 未配置备用时使用主 provider ({elapsed:.2f}s)")
+        else:
+            print(f"❌ 主 provider 结果错误: '{text}'")
+            passed = False
+
+        # 3. 故障切换 + 熔断：主 provider 返回 500
+        os.environ["OPENAI_BASE_URL"] = broken_url
+        llm_pool.configs.clear()
+        await llm_pool.aclose()
+        router = LLMRouter(fallback_provider="deepseek", hedge_after=30)
+        for attempt in range(3):
+            text, elapsed = await collect(router, "local")
+            if text != "fast fallback answer":
+                print(f"❌ 第 {attempt + 1} 次故障切换失败: '{text}'")
+                passed = False
+        state = router.breaker("local").state
+        if state == "open":
+            print("✅ 主 provider 连续失败后熔断器打开")
+        else:
+            print(f"❌ 熔断器状态错误: {state}")
+            passed = False
+
+        text, elapsed = await collect(router, "local")
+        if text == "fast fallback answer" and elapsed < 1.0:
+            print(f"✅ 熔断期间直接路由到备用 provider ({elapsed:.2f}s)")
+        else:
+            print(f"❌ 熔断期间路由错误: '{text}' ({elapsed:.2f}s)")
+            passed = False
+
+        # 4. 排队已满：返回 ProviderBusyError，多次拒绝也不打开熔断器
+        saved = llm_limiters.limiters.get("local")
+        full = ProviderLimiter("local", 1, 0)
+        full.active = 1  # 并发已占满且不允许排队
+        llm_limiters.limiters["local"] = full
+        router = LLMRouter(fallback_provider="", hedge_after=30)
+        busy_count = 0
+        for _ in range(4):
+            try:
+                await collect(router, "local")
+            except ProviderBusyError as busy:
+                busy_count += 1 if type(busy) is ProviderBusyError else 0
+        if busy_count == 4 and router.breaker("local").state == "closed":
+            print("✅ 排队已满时返回 busy，且不触发熔断")
+        else:
+            print(f"❌ 排队拒绝处理错误: busy={busy_count}, state={router.breaker('local').state}")
+            passed = False
+        if saved is not None:
+            llm_limiters.limiters["local"] = saved
+        else:
+            del llm_limiters.limiters["local"]
+
+        # 5. 半开状态只放行一个试探请求
+        breaker = CircuitBreaker("trial", failure_threshold=1, reset_seconds=0.2)
+        breaker.record_failure()
+        await asyncio.sleep(0.25)
+        first, second = breaker.allow(), breaker.allow()
+        breaker.record_success()
+        if first and not second and breaker.allow():
+            print("✅ 半开状态只放行一个试探请求，成功后关闭")
+        else:
+            print(f"❌ 半开放行错误: first={first}, second={second}, state={breaker.state}")
+            passed = False
+
+        await llm_pool.aclose()
+
+    asyncio.run(run())
+
+    for server in (slow_server, fast_server, broken_server):
+        server.shutdown()
+
+    print("=" * 60)
+    print("✓ 测试完成" if passed else "✗ 存在失败项")
+    print("=" * 60)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())